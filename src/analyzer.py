@@ -0,0 +1,236 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from consts import *
+from scenario_pack import compile_pack, SCHEMA_PATH
+from simulation import BatchSimulation, effect_matrix, greedy_policy, random_policy
+
+# Balance report for a scenarios file, from simulated games on the game's rules (simulation.BatchSimulation). Games
+# get split into chunks with seeds of their own and played on a process pool, so the report only depends on --seed and
+# --games, not on how many processes played them.
+#
+# Every choice gets:
+#   - whether it's dominated: never better than the other choice on any meter, so nobody should ever pick it
+#   - its effect on survival: how many more years the games where random play picked it lasted, against the games
+#     where random play picked the other choice. Random play picks choices by coin flip, so this difference is down
+#     to the choice itself.
+#   - how often greedy play (best chance of being fired after the quarter) picks it
+# Every scenario gets its effect on survival the same way, against every scenario shown, and its expected meter drift,
+# the average of its two choices. The pack gets survival curves and meter drift per quarter for both kinds of play.
+
+POLICIES = {
+    "random": random_policy,
+    "greedy": greedy_policy
+}
+
+ChunkResult = Dict[str, np.ndarray]
+
+worker_effects: Optional[np.ndarray] = None  # Each worker process gets the effect matrix once, see start_worker()
+
+
+def start_worker(effects: np.ndarray):
+    global worker_effects
+    worker_effects = effects
+
+
+def simulate_chunk(policy: str, seed: np.random.SeedSequence, games: int, years: int) -> ChunkResult:
+    # Plays one chunk of games to the end of years, or until everyone is fired. Tallies, per option (scenario * 2 +
+    # choice), how often it got picked and how many years the games that picked it lasted.
+    sim = BatchSimulation([], games, seed, effects=worker_effects)
+    picked_games = []
+    picked_options = []
+    drift = np.zeros(len(METERS), dtype=np.int64)
+    quarters = 0
+    for _ in range(years * 4):
+        if not sim.alive.any():
+            break
+        before = sim.meters[sim.alive]
+        running, draws, choices = sim.step(POLICIES[policy])
+        drift += (sim.meters[running] - before).sum(axis=0)
+        quarters += len(running)
+        picked_games.append(np.repeat(running, 4))
+        picked_options.append((draws * 2 + choices).ravel())
+    sim.years_survived[sim.alive] = sim.year - 1  # Same as BatchSimulation.run()
+
+    options = len(sim.effects) * 2
+    picked_games = np.concatenate(picked_games)
+    picked_options = np.concatenate(picked_options)
+    return {
+        "fired": np.bincount(sim.years_survived[~sim.alive], minlength=years + 1),  # By the year of the review
+        "picks": np.bincount(picked_options, minlength=options),
+        "pick_years": np.bincount(picked_options, weights=sim.years_survived[picked_games], minlength=options),
+        "drift": drift,
+        "quarters": np.array(quarters)
+    }
+
+
+def simulate(effects: np.ndarray, games: int, years: int, chunk: int, workers: int,
+             seed: Optional[int]) -> Dict[str, ChunkResult]:
+    # Totals of every chunk, per policy
+    totals: Dict[str, ChunkResult] = {}
+    seeds = np.random.SeedSequence(seed).spawn(len(POLICIES))
+    with ProcessPoolExecutor(workers, initializer=start_worker, initargs=(effects,)) as pool:
+        futures = []
+        for policy, policy_seed in zip(POLICIES, seeds):
+            sizes = [min(chunk, games - start) for start in range(0, games, chunk)]
+            for size, chunk_seed in zip(sizes, policy_seed.spawn(len(sizes))):
+                futures.append((policy, pool.submit(simulate_chunk, policy, chunk_seed, size, years)))
+        for policy, future in futures:
+            result = future.result()
+            if policy not in totals:
+                totals[policy] = result
+            else:
+                for key, value in result.items():
+                    totals[policy][key] = totals[policy][key] + value
+    return totals
+
+
+def dominated(effects: np.ndarray) -> np.ndarray:
+    # (scenarios, 2) whether each choice is never better than the other one on any meter. Choices that are the same on
+    # every meter don't count, neither is worse.
+    left, right = effects[:, 0], effects[:, 1]
+    left_dominated = (left <= right).all(axis=1) & (left != right).any(axis=1)
+    right_dominated = (right <= left).all(axis=1) & (left != right).any(axis=1)
+    return np.stack([left_dominated, right_dominated], axis=1)
+
+
+def mean_years(pick_years: np.ndarray, picks: np.ndarray) -> np.ndarray:
+    # Average years lasted by the games behind each count, NaN where there weren't any
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return pick_years / picks
+
+
+def finite(value: float) -> Optional[float]:
+    # JSON has no NaN
+    return None if np.isnan(value) else float(value)
+
+
+def analyze(scenarios: List[Dict[str, Any]], totals: Dict[str, ChunkResult], games: int,
+            years: int) -> Dict[str, Any]:
+    effects = effect_matrix(scenarios)
+    weak = dominated(effects)
+
+    # Effects on survival, from random play
+    random_totals = totals["random"]
+    choice_years = mean_years(random_totals["pick_years"], random_totals["picks"]).reshape(-1, 2)
+    scenario_picks = random_totals["picks"].reshape(-1, 2).sum(axis=1)
+    scenario_years = mean_years(random_totals["pick_years"].reshape(-1, 2).sum(axis=1), scenario_picks)
+    baseline = random_totals["pick_years"].sum() / max(random_totals["picks"].sum(), 1)
+
+    greedy_picks = totals["greedy"]["picks"].reshape(-1, 2)
+    greedy_shown = greedy_picks.sum(axis=1)
+
+    report_scenarios = []
+    for i, scenario in enumerate(scenarios):
+        choices = []
+        for choice, text in enumerate((CHOICE_ONE, CHOICE_TWO)):
+            choices.append({
+                "text": scenario[text],
+                "effects": dict(zip(METERS, effects[i, choice].tolist())),
+                "dominated": bool(weak[i, choice]),
+                "survival_effect_years": finite(choice_years[i, choice] - choice_years[i, 1 - choice]),
+                "greedy_pick_rate": finite(greedy_picks[i, choice] / greedy_shown[i]) if greedy_shown[i] else None
+            })
+        report_scenarios.append({
+            "index": i,
+            "text": scenario[SCENARIO_TEXT],
+            "shown": int(scenario_picks[i]),
+            "survival_effect_years": finite(scenario_years[i] - baseline),
+            "expected_drift": dict(zip(METERS, effects[i].mean(axis=0).tolist())),
+            "choices": choices
+        })
+
+    policies = {}
+    for policy, result in totals.items():
+        fired = result["fired"].cumsum()  # Games fired at or before each year's review
+        policies[policy] = {
+            "survival_by_year": [float(1 - fired[year] / games) for year in range(1, years + 1)],
+            "drift_per_quarter": dict(zip(METERS, (result["drift"] / max(int(result["quarters"]), 1)).tolist()))
+        }
+
+    return {
+        "games_per_policy": games,
+        "years": years,
+        "dominated_choices": int(weak.sum()),
+        "policies": policies,
+        "scenarios": report_scenarios
+    }
+
+
+def write_csv(report: Dict[str, Any], path: Path):
+    # One row per choice
+    with path.open("w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["scenario", "choice", "scenario_text", "choice_text", *METERS, "dominated", "shown",
+                         "scenario_survival_effect_years", "choice_survival_effect_years", "greedy_pick_rate",
+                         *(f"expected_drift_{meter}" for meter in METERS)])
+        for scenario in report["scenarios"]:
+            for choice, details in enumerate(scenario["choices"]):
+                writer.writerow([scenario["index"], choice, scenario["text"], details["text"],
+                                 *details["effects"].values(), details["dominated"], scenario["shown"],
+                                 scenario["survival_effect_years"], details["survival_effect_years"],
+                                 details["greedy_pick_rate"], *scenario["expected_drift"].values()])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Balance report for a scenarios file, from simulated games")
+    parser.add_argument("scenarios", type=Path, help="scenarios JSON file")
+    parser.add_argument("--schema", type=Path, default=SCHEMA_PATH, help="JSON schema to validate against")
+    parser.add_argument("--games", type=int, default=100_000, help="games to simulate per policy")
+    parser.add_argument("--years", type=int, default=10, help="stop games still running after this many years")
+    parser.add_argument("--chunk", type=int, default=10_000, help="games per process pool task")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes to simulate on")
+    parser.add_argument("--seed", type=int, help="seed the simulations, for reports that can be reproduced")
+    parser.add_argument("--json", type=Path, metavar="FILE", help="write the full report to FILE")
+    parser.add_argument("--csv", type=Path, metavar="FILE", help="write one row per choice to FILE")
+    args = parser.parse_args()
+
+    if args.games < 1 or args.years < 1 or args.chunk < 1 or args.workers < 1:
+        parser.error("--games, --years, --chunk and --workers have to be at least 1")
+
+    with args.scenarios.open(encoding="utf-8") as fp:
+        scenarios = json.load(fp)
+    with args.schema.open(encoding="utf-8") as fp:
+        schema = json.load(fp)
+    try:
+        compile_pack(scenarios, schema)  # Same checks the build runs
+    except ValueError as e:
+        sys.exit(f"{args.scenarios}: {e}")
+    if len(scenarios) < 4:
+        sys.exit(f"{args.scenarios}: need at least 4 scenarios to play")
+
+    start = perf_counter()
+    totals = simulate(effect_matrix(scenarios), args.games, args.years, args.chunk, args.workers, args.seed)
+    report = analyze(scenarios, totals, args.games, args.years)
+    elapsed = perf_counter() - start
+
+    print(f"Simulated {args.games * len(POLICIES)} games in {elapsed:.1f}s")
+    print(f"Dominated choices: {report['dominated_choices']}")
+    for policy, results in report["policies"].items():
+        curve = ", ".join(f"Y{year}: {rate:.1%}" for year, rate in enumerate(results["survival_by_year"], 1))
+        print(f"Survival with {policy} play: {curve}")
+    ranked = sorted((s for s in report["scenarios"] if s["survival_effect_years"] is not None),
+                    key=lambda s: s["survival_effect_years"])
+    for label, picks in (("Hardest", ranked[:5]), ("Easiest", ranked[:-6:-1])):
+        print(f"{label} scenarios:")
+        for scenario in picks:
+            print(f"  {scenario['index']:5} {scenario['survival_effect_years']:+.3f} years  {scenario['text'][:70]}")
+
+    if args.json:
+        with args.json.open("w", encoding="utf-8") as fp:
+            json.dump(report, fp, indent=2)
+    if args.csv:
+        write_csv(report, args.csv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from pygame import image, Rect, Surface
+from pygame.locals import SRCALPHA
+from pygame.mixer import Sound
+
+import scaling
+
+# Conversion modes for loaded images
+CONVERT = "convert"              # Opaque, display pixel format
+CONVERT_ALPHA = "convert_alpha"  # Per-pixel alpha, display pixel format
+
+
+class AssetCache:
+    # Process-wide surface cache. Each (path, mode) pair is loaded from disk, decoded and converted exactly once, and
+    # the same Surface is handed out to every caller afterwards. Those surfaces are shared, so never draw onto them.
+    #
+    # Decoding can be handed off by setting decoder (see preloader.py): it gets the path and returns the decoded,
+    # unconverted file, or None to have it loaded here. Conversion always happens on the thread calling load().
+    def __init__(self):
+        self.surfaces: Dict[Tuple[Path, str], Surface] = {}
+        self.atlas_regions: Dict[Path, Surface] = {}  # Every image a texture atlas has, as it is in the atlas
+        self.sounds: Dict[Path, Sound] = {}
+        self.decoder: Optional[Callable[[Path], Optional[Union[Surface, Sound]]]] = None
+        self.hits = 0
+        self.misses = 0
+        self.bytes_held = 0
+
+    def load(self, path: Union[str, Path], mode: str = CONVERT) -> Surface:
+        key = (Path(path), mode)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.hits += 1
+            return surf
+
+        self.misses += 1
+        region = self.atlas_regions.get(key[0])
+        if region is not None:  # In an atlas packed for the other mode, the file itself might not even ship
+            return self.add(key[0], mode, region)
+        surf = self.decode(key[0])
+        return self.add(key[0], mode, surf if surf is not None else image.load(key[0]))
+
+    def add(self, path: Path, mode: str, surf: Surface) -> Surface:
+        # Converts a decoded image and caches it, unless it already was
+        key = (path, mode)
+        if key in self.surfaces:
+            return self.surfaces[key]
+        if mode == CONVERT:
+            surf = surf.convert()
+        elif mode == CONVERT_ALPHA:
+            surf = surf.convert_alpha()
+        else:
+            raise ValueError(f"Unknown conversion mode: {mode}")
+        self.bytes_held += surf.get_pitch() * surf.get_height()
+        return self.store(key, surf)
+
+    def add_atlas(self, surf: Surface, mode: str, regions: Dict[Path, Rect]):
+        # Caches every image of a texture atlas (see atlas.py) as a subsurface of its one surface. The atlas gets
+        # converted like an image would be, except when its pixels already are in the display's per-pixel alpha
+        # format: then the surface, and whatever its pixels live in, gets used as is. Loading one of its images in
+        # the other mode converts a copy of its region, the first time it's asked for.
+        if mode == CONVERT:
+            surf = surf.convert()
+        elif mode == CONVERT_ALPHA:
+            if surf.get_masks() != Surface((1, 1), SRCALPHA).convert_alpha().get_masks():
+                surf = surf.convert_alpha()
+        else:
+            raise ValueError(f"Unknown conversion mode: {mode}")
+        self.bytes_held += surf.get_pitch() * surf.get_height()
+        for path, rect in regions.items():
+            region = self.atlas_regions[path] = surf.subsurface(rect)
+            if (path, mode) not in self.surfaces:
+                self.store((path, mode), region)
+
+    def store(self, key: Tuple[Path, str], surf: Surface) -> Surface:
+        if scaling.scaler is not None:
+            scaling.scaler.scaled(surf)  # Scaled for the display right away too, instead of on the first draw
+        self.surfaces[key] = surf
+        return surf
+
+    def load_sound(self, path: Union[str, Path]) -> Sound:
+        path = Path(path)
+        sound = self.sounds.get(path)
+        if sound is not None:
+            self.hits += 1
+            return sound
+
+        self.misses += 1
+        sound = self.decode(path)
+        self.sounds[path] = sound if sound is not None else Sound(path)
+        return self.sounds[path]
+
+    def decode(self, path: Path) -> Optional[Union[Surface, Sound]]:
+        return self.decoder(path) if self.decoder is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.surfaces) + len(self.sounds),
+            "bytes": self.bytes_held
+        }
+
+    def overlay_lines(self) -> List[str]:
+        return [f"asset cache  hits {self.hits}  misses {self.misses}  "
+                f"entries {len(self.surfaces) + len(self.sounds)}  {self.bytes_held / 2 ** 20:.1f} MB"]
+
+    def clear(self):
+        self.surfaces.clear()
+        self.atlas_regions.clear()
+        self.sounds.clear()
+        self.bytes_held = 0
+
+
+asset_cache = AssetCache()
+
+
+def load_image(path: Union[str, Path], mode: str = CONVERT) -> Surface:
+    return asset_cache.load(path, mode)
+
+
+def load_sound(path: Union[str, Path]) -> Sound:
+    return asset_cache.load_sound(path)
@@ -0,0 +1,133 @@
+import argparse
+import json
+import mmap
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pygame import image, Rect, Surface
+
+from assets import CONVERT, CONVERT_ALPHA
+from caching import stale
+from consts import *
+
+# Texture atlases. At build time a set of images gets packed into one big image, stored as raw pixels in the layout
+# most displays use, next to a manifest of where each image ended up. At runtime the file is memory-mapped and turned
+# into a surface with image.frombuffer(), no decoding involved, and every image in it becomes a subsurface of that one
+# surface (see AssetCache.add_atlas()).
+#
+# Layout, all little-endian:
+#   header    magic, version, manifest length, offset of the pixels
+#   manifest  UTF-8 JSON: width, height, conversion mode and each image's [x, y, w, h], by path relative to the atlas
+#   pixels    BGRA, 4 bytes per pixel, rows top to bottom, starting on a page boundary
+
+MAGIC = b"ATBATLS\0"
+VERSION = 1
+HEADER = struct.Struct("<8sHII")
+PIXEL_FORMAT = "BGRA"  # Byte order of 32-bit ARGB, the format convert_alpha() gives on most displays
+PAGE_SIZE = 4096
+MAX_WIDTH = 1024
+
+ATLAS_PATH = ASSETS_DIR / "ui.atlas"
+ATLAS_SOURCES = (ASSETS_DIR / "buttons", ASSETS_DIR / "meters")  # Every PNG in these goes in the atlas
+
+
+def pack_rects(sizes: List[Tuple[int, int]], max_width: int = MAX_WIDTH) -> Tuple[int, int, List[Tuple[int, int]]]:
+    # Shelf packing, tallest first: fills rows left to right, each row as tall as its first image. Returns the atlas
+    # size and where each size went.
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+    positions: List[Tuple[int, int]] = [(0, 0)] * len(sizes)
+    x = y = shelf_height = width = 0
+    for i in order:
+        w, h = sizes[i]
+        if x > 0 and x + w > max_width:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        positions[i] = (x, y)
+        x += w
+        shelf_height = max(shelf_height, h)
+        width = max(width, x)
+    return width, y + shelf_height, positions
+
+
+def build_atlas(paths: List[Path], root: Path, mode: str = CONVERT, max_width: int = MAX_WIDTH) -> bytes:
+    # root is the directory the atlas goes in, images are listed by their path relative to it
+    images = [image.load(path) for path in paths]
+    width, height, positions = pack_rects([surf.get_size() for surf in images], max_width)
+
+    pixels = bytearray(width * height * 4)
+    regions = {}
+    for path, surf, (x, y) in zip(paths, images, positions):
+        w, h = surf.get_size()
+        data = bytearray(image.tobytes(surf, PIXEL_FORMAT))
+        if mode == CONVERT:
+            data[3::4] = b"\xff" * (w * h)  # Opaque, like convert() would make it
+        for row in range(h):
+            start = ((y + row) * width + x) * 4
+            pixels[start:start + w * 4] = data[row * w * 4:(row + 1) * w * 4]
+        regions[path.relative_to(root).as_posix()] = [x, y, w, h]
+
+    manifest = json.dumps({"width": width, "height": height, "mode": mode, "regions": regions}).encode("utf-8")
+    data_offset = HEADER.size + len(manifest)
+    data_offset += -data_offset % PAGE_SIZE
+    header = HEADER.pack(MAGIC, VERSION, len(manifest), data_offset)
+    return header + manifest + bytes(data_offset - HEADER.size - len(manifest)) + pixels
+
+
+class Atlas:
+    def __init__(self, path: Path):
+        self.path = path
+        with path.open("rb") as fp:
+            self.buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, manifest_size, data_offset = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a compatible texture atlas")
+        manifest = json.loads(self.buffer[HEADER.size:HEADER.size + manifest_size])
+        self.mode: str = manifest["mode"]
+        size = (manifest["width"], manifest["height"])
+        self.regions: Dict[Path, Rect] = {path.parent / name: Rect(rect) for name, rect in manifest["regions"].items()}
+
+        # Zero-copy: the surface's pixels are the mapped file, paged in as they're read
+        pixels = memoryview(self.buffer)[data_offset:data_offset + size[0] * size[1] * 4]
+        self.surface: Surface = image.frombuffer(pixels, size, PIXEL_FORMAT)
+
+
+def load_atlas(path: Path = ATLAS_PATH) -> Optional[Atlas]:
+    # The atlas, if there is one and none of its images changed since it was built
+    if not path.exists():
+        return None
+    atlas = Atlas(path)
+    if stale(path, atlas.regions):
+        return None
+    return atlas
+
+
+def source_images(sources: Iterable[Path]) -> List[Path]:
+    return sorted(path for source in sources for path in source.glob("*.png"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack the UI images into a texture atlas")
+    parser.add_argument("output", type=Path, nargs="?", default=ATLAS_PATH, help="where to write the atlas")
+    parser.add_argument("--sources", type=Path, nargs="+", default=list(ATLAS_SOURCES),
+                        help="directories to pack every PNG of, below the atlas's own directory")
+    parser.add_argument("--mode", choices=(CONVERT, CONVERT_ALPHA), default=CONVERT,
+                        help="how the game loads these images, convert_alpha keeps their transparency")
+    parser.add_argument("--max-width", type=int, default=MAX_WIDTH, help="widest the atlas gets, in pixels")
+    args = parser.parse_args()
+
+    paths = source_images(args.sources)
+    if not paths:
+        sys.exit("No images to pack")
+    root = args.output.parent
+    try:
+        atlas = build_atlas(paths, root, args.mode, args.max_width)
+    except ValueError as e:  # An image outside root
+        sys.exit(str(e))
+    args.output.write_bytes(atlas)
+    print(f"Wrote {len(paths)} images to {args.output} ({len(atlas)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+from collections import deque
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Deque, Dict, List, Optional
+
+import pygame
+from pygame.mixer import Channel, Sound
+
+from assets import load_sound
+from consts import *
+from metrics import latency_stats
+
+# Everything the game plays goes through here. The mixer gets a small buffer, so sounds start soon after they're
+# played, and UI sounds get channels of their own, so a click never has to wait for or cut off the one before it.
+#
+# Music calls need care: pygame.mixer.music locks the audio device while holding the GIL, and whenever a sound finishes
+# the audio thread takes the GIL while it holds that same lock. Pausing the music just as a click ends deadlocks both.
+# So music calls wait in a queue until none of our channels has a sound that could still finish. A channel's sound only
+# gets cleared by that audio thread callback, after it got the GIL, so once every one of them is clear nothing can be
+# left holding the lock.
+
+AUDIO_FREQUENCY = 44100
+UI_CHANNELS = 4  # Enough for a quick burst of clicks to all play out
+
+
+class AudioManager:
+    def __init__(self):
+        self.buffer = AUDIO_BUFFER
+        self.enabled = False  # Whether the mixer came up, without it everything here does nothing
+        self.channels: List[Channel] = []
+        self.next_channel = 0
+        self.sounds: Dict[Path, Sound] = {}  # Decoded sounds with their volume already set
+        self.music_loaded = False
+        self.music_commands: Deque[Callable[[], None]] = deque()
+
+        # Time from pulling a click off the queue until its sound leaves the mixer, in seconds
+        self.input_received: Optional[float] = None
+        self.latencies = deque(maxlen=600)
+
+    def pre_init(self, buffer: int = AUDIO_BUFFER):
+        # Before pygame.init(), which opens the mixer with these settings
+        self.buffer = buffer
+        pygame.mixer.pre_init(AUDIO_FREQUENCY, -16, 2, buffer)
+
+    def start(self):
+        # After pygame.init()
+        self.enabled = pygame.mixer.get_init() is not None
+        if self.enabled:
+            pygame.mixer.set_reserved(UI_CHANNELS)  # Kept out of the way of Sound.play(), for play_ui() only
+            self.channels = [Channel(i) for i in range(UI_CHANNELS)]
+
+    def output_latency(self) -> float:
+        # How long the mixer's buffer holds a sound back once it's played
+        init = pygame.mixer.get_init()
+        return self.buffer / init[0] if init else 0.0
+
+    def sound(self, path: Path, volume: float = 1.0) -> Sound:
+        sound = self.sounds.get(path)
+        if sound is None:
+            sound = self.sounds[path] = load_sound(path)
+            sound.set_volume(volume)
+        return sound
+
+    def play_ui(self, sound: Sound):
+        if not self.enabled:
+            return
+        # An idle channel if there is one, otherwise the one that started playing longest ago
+        for i in range(UI_CHANNELS):
+            channel = self.channels[(self.next_channel + i) % UI_CHANNELS]
+            if channel.get_sound() is None:
+                break
+        else:
+            channel = self.channels[self.next_channel]
+        self.next_channel = (self.channels.index(channel) + 1) % UI_CHANNELS
+        channel.play(sound)
+
+        if self.input_received is not None:
+            self.latencies.append(perf_counter() - self.input_received + self.output_latency())
+            self.input_received = None
+
+    def click_received(self):
+        # Called as a click comes off the event queue, the sound it plays gets timed from here
+        self.input_received = perf_counter()
+
+    def latency_stats(self) -> Dict[str, float]:
+        return latency_stats(self.latencies)
+
+    def music(self, command: Callable[[], None]):
+        if self.enabled:
+            self.music_commands.append(command)
+            self.run_music_commands()
+
+    def run_music_commands(self):
+        # See the top of the file. Called every frame to catch up on commands that had to wait.
+        if self.music_commands and all(channel.get_sound() is None for channel in self.channels):
+            while self.music_commands:
+                self.music_commands.popleft()()
+
+    def load_music(self, path: Path, volume: float):
+        def load():
+            pygame.mixer.music.load(path)
+            pygame.mixer.music.set_volume(volume)
+            self.music_loaded = True
+        self.music(load)
+
+    def play_music(self):
+        # Starts the music over if it isn't playing, paused music included
+        def play():
+            if self.music_loaded and not pygame.mixer.music.get_busy():
+                pygame.mixer.music.play(loops=-1)  # Loop forever
+        self.music(play)
+
+    def pause_music(self):
+        self.music(pygame.mixer.music.pause)
+
+    def unpause_music(self):
+        self.music(pygame.mixer.music.unpause)
+
+    def stop_music(self):
+        # Paused and back at the start, for play_music() to pick up again
+        def stop():
+            if self.music_loaded:
+                pygame.mixer.music.pause()
+                pygame.mixer.music.rewind()
+        self.music(stop)
+
+    def overlay_lines(self) -> List[str]:
+        stats = self.latency_stats()
+        if not stats:
+            return []
+        return [f"click to sound ms  mean {stats['mean'] * 1000:.1f}  p95 {stats['p95'] * 1000:.1f}  "
+                f"(buffer {self.buffer})"]
+
+
+audio = AudioManager()
@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from statistics import mean, median
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+from metrics import percentile
+
+# Headless benchmarks of the game's hot paths. Run from the repository root:
+#     python src/benchmark.py --out bench.json
+#     python src/benchmark.py --compare bench.json
+# Everything runs on SDL's dummy video and audio drivers, so no window opens and the numbers do not depend on a
+# compositor. The game's RNG gets seeded before every benchmark, so each run does exactly the same work.
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+STORM_FRAMES = 60
+STORM_EVENTS_PER_FRAME = 16  # A 1000 Hz mouse moving the whole time
+
+Result = Dict[str, float]
+
+
+def summarize(times: List[float]) -> Result:
+    ordered = sorted(times)
+    return {
+        "runs": len(ordered),
+        "min_ms": ordered[0] * 1000,
+        "median_ms": median(ordered) * 1000,
+        "mean_ms": mean(ordered) * 1000,
+        "p95_ms": percentile(ordered, 95) * 1000
+    }
+
+
+def measure(func: Callable[[], None], repeat: int, setup: Optional[Callable[[], None]] = None) -> Result:
+    # One warm up call, so one off costs (first font render, asset loads) don't end up in the numbers
+    if setup is not None:
+        setup()
+    func()
+
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return summarize(times)
+
+
+def startup_probe():
+    # Runs the game until its first frame is on screen, then reports when that was and quits
+    start = perf_counter()
+    import pygame
+    flip = pygame.display.flip
+
+    def first_flip():
+        flip()
+        print(json.dumps({"wall": time.time(), "in_process": perf_counter() - start}), flush=True)
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+        pygame.display.flip = flip
+
+    pygame.display.flip = first_flip
+    import main
+    sys.argv = [sys.argv[0]]
+    main.main()
+
+
+def bench_startup(repeat: int) -> Dict[str, Result]:
+    # Fresh interpreters, so imports, pygame.init and the first asset loads all count
+    wall, in_process = [], []
+    for _ in range(repeat):
+        spawned = time.time()
+        output = subprocess.run([sys.executable, __file__, "--startup-probe"], check=True, capture_output=True,
+                                text=True).stdout
+        first_frame = json.loads(output.strip().splitlines()[-1])
+        wall.append(first_frame["wall"] - spawned)
+        in_process.append(first_frame["in_process"])
+    return {"startup process to first frame": summarize(wall),
+            "startup import to first frame": summarize(in_process)}
+
+
+def bench_game(repeat: int) -> Dict[str, Result]:
+    import pygame
+    from pygame import Rect, Surface
+    from pygame.event import Event
+    from pygame.locals import MOUSEBUTTONUP, MOUSEMOTION, SRCALPHA
+
+    from consts import (CHOICE_ONE, CHOICE_TWO, DARKER_FONT_COLOR, FONT_COLOR, MOUSE_LEFT_CLICK,
+                        SCENARIO_TEXT, SCREEN_HEIGHT, SCREEN_WIDTH, VERDANA)
+    from fonts import font_registry, get_font
+    from inputs import InputRouter
+    from main import GameState, handle_events
+    from render import Renderer
+    import sprites
+
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    font_registry.warm_up()
+    results = {}
+
+    random.seed(0)
+    game = GameState(GameState.States.TITLE_SCREEN, True)
+    for state in GameState.States:
+        def setup(state=state):
+            game.screen_state = state
+            game.current_indices = ()  # Draw new scenarios every time, same as a new quarter
+        results[f"build_screen {state.name}"] = measure(game.build_screen, repeat, setup)
+
+    def new_quarter():
+        # Stay in the first year so the board never gets a say
+        game.screen_state = GameState.States.GAMEPLAY
+        game.year = 1
+        game.quarter = 1
+        game.do_background_work(1.0)  # Whatever idle frames would have gotten ready in the meantime
+    random.seed(0)
+    results["transition_round"] = measure(game.transition_round, repeat, new_quarter)
+
+    # Every scenario text at the size the prompts lay it out at
+    random.seed(0)
+    new_quarter()
+    game.build_screen()
+    prompt = next(sprite for sprite in game.all_sprites if isinstance(sprite, sprites.Prompt))
+    layouts = [(SCENARIO_TEXT, prompt.prompt_text.rect.size, get_font(VERDANA, 20), FONT_COLOR),
+               (CHOICE_ONE, prompt.left_button.text.rect.size, get_font(VERDANA, 16), DARKER_FONT_COLOR),
+               (CHOICE_TWO, prompt.right_button.text.rect.size, get_font(VERDANA, 16), DARKER_FONT_COLOR)]
+    surfaces = [Surface(size, SRCALPHA) for _, size, _, _ in layouts]
+
+    def wrap_every_scenario():
+        for scenario in game.scenarios:
+            for (key, size, font, color), surf in zip(layouts, surfaces):
+                sprites.draw_text_wrapped(surf, scenario[key], color, Rect((0, 0), size), font)
+    results["draw_text_wrapped every scenario"] = measure(wrap_every_scenario, repeat)
+
+    def full_frame():
+        screen.blit(game.background, game.background.get_rect())
+        game.draw(screen)
+    results["full frame"] = measure(full_frame, repeat)
+
+    # Mouse storm over the gameplay screen, dispatched and drawn the way the main loop does it
+    renderer = Renderer(screen)
+    rng = random.Random(0)
+    storm_game = None
+    router = InputRouter()  # Shared by every run, so its latencies cover all of them
+
+    def start_storm():
+        nonlocal storm_game
+        random.seed(0)
+        storm_game = GameState(GameState.States.GAMEPLAY, True, router=router)
+        renderer.render(storm_game, storm_game.background)
+        pygame.event.clear()
+
+    def storm():
+        nonlocal storm_game
+        for _ in range(STORM_FRAMES):
+            for _ in range(STORM_EVENTS_PER_FRAME):
+                pos = (rng.randrange(SCREEN_WIDTH), rng.randrange(SCREEN_HEIGHT))
+                pygame.event.post(Event(MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(0, 0, 0)))
+            if rng.random() < 0.2:
+                pygame.event.post(Event(MOUSEBUTTONUP, pos=pos, button=MOUSE_LEFT_CLICK))
+            _, storm_game = handle_events(storm_game)
+            renderer.render(storm_game, storm_game.background)
+            storm_game.input.frame_presented()
+    results["mouse storm"] = measure(storm, repeat, start_storm)
+    results["mouse storm"]["frames"] = STORM_FRAMES
+    hover = router.latency_stats()  # From pulling the motion off the queue to the frame showing its hover states
+    results["mouse storm"]["hover_mean_ms"] = hover["mean"] * 1000
+    results["mouse storm"]["hover_p95_ms"] = hover["p95"] * 1000
+
+    pygame.quit()
+    return results
+
+
+def compare(results: Dict[str, Result], baseline: Dict[str, Result], threshold: float) -> List[str]:
+    # Prints how every benchmark moved against the baseline, returns the ones that got slower than the threshold
+    regressions = []
+    print(f"{'benchmark':40} {'baseline':>12} {'now':>12} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:40} {'-':>12} {result['median_ms']:10.3f}ms {'new':>8}")
+            continue
+        before = baseline[name]["median_ms"]
+        change = result["median_ms"] / before - 1 if before else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:40} {before:10.3f}ms {result['median_ms']:10.3f}ms {change:+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmarks of rendering, layout and state transitions")
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs per benchmark")
+    parser.add_argument("--startup-repeat", type=int, default=5, help="fresh processes to time startup with")
+    parser.add_argument("--out", type=Path, help="write the results here as JSON")
+    parser.add_argument("--compare", type=Path, metavar="BASELINE", help="compare against results saved with --out")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown of the median that counts as a regression, 0.10 is 10%%")
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_probe:
+        startup_probe()
+        return
+
+    results = bench_startup(args.startup_repeat)
+    results.update(bench_game(args.repeat))
+
+    import pygame
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "sdl": ".".join(map(str, pygame.get_sdl_version())),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "results": results
+    }
+    if args.out:
+        with args.out.open("w") as fp:
+            json.dump(report, fp, indent=2)
+
+    if args.compare:
+        with args.compare.open() as fp:
+            baseline = json.load(fp)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            sys.exit(f"{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+    else:
+        for name, result in results.items():
+            hover = f"  hover p95 {result['hover_p95_ms']:.3f}ms" if "hover_p95_ms" in result else ""
+            print(f"{name:40} median {result['median_ms']:10.3f}ms  p95 {result['p95_ms']:10.3f}ms{hover}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Tuple, TypeVar
+
+# Small pieces shared by everything that builds something once and reuses it: files built ahead of time from other
+# files (scenario packs, texture atlases), and tables built in memory for one set of scenarios.
+
+T = TypeVar("T")
+
+
+def stale(built: Path, sources: Iterable[Path]) -> bool:
+    # Whether any of the files built was made from changed after it was built. Sources that are gone don't count.
+    # Frozen builds never count as stale: their files' timestamps mean nothing, and they might not ship the sources.
+    if getattr(sys, "frozen", False):
+        return False
+    built_at = built.stat().st_mtime
+    return any(source.exists() and source.stat().st_mtime > built_at for source in sources)
+
+
+class IdentityCache:
+    # Values built once per object, for objects that can't be hashed or would be slow to hash, like a list of
+    # scenarios. Entries are keyed by id() and keep their object alive, so the id can't get reused by another one.
+    def __init__(self):
+        self.entries: Dict[int, Tuple[Any, Any]] = {}
+
+    def get(self, key, build: Callable[[], T]) -> T:
+        # build makes the value, it only gets called the first time
+        entry = self.entries.get(id(key))
+        if entry is None or entry[0] is not key:
+            entry = self.entries[id(key)] = (key, build())
+        return entry[1]
+
+    def clear(self):
+        self.entries.clear()
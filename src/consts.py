@@ -1,8 +1,6 @@
 import sys
 from pathlib import Path
 
-from pygame.event import custom_type
-
 # Random stuff
 SCREEN_WIDTH = 1280
 SCREEN_HEIGHT = 720
@@ -11,17 +9,26 @@ FONT_COLOR = (222, 222, 222)
 BACKGROUND_COLOR = (100, 100, 100)
 DARKER_FONT_COLOR = (51, 51, 51)
 WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
 VERDANA = "Verdana"
 COMIC_SANS = "Comic Sans"
-NEWGAME = custom_type()
 PROMPT_X_POS = 380
 CHOICE_BTN_X_POS = 712
+PROMPT_Y_POSITIONS = (10, 189, 366, 543)
+DIRTY_RECT_RENDERING = True  # Only redraw and update the parts of the screen that changed
+BACKGROUND_WORK_BUDGET = 0.002  # Seconds of each frame that can go to getting things ready ahead of time
+FRAME_RATE = 60  # Frames per second while anything on screen is changing
+IDLE_POLL_MS = 33  # How often the event queue gets checked once nothing is changing, about every other frame
+IDLE_WAIT_MS = 500  # Longest the game stays asleep once nothing is changing, even without events
+ACTIVE_LINGER = 0.25  # Seconds to keep the full frame rate after the last change, so hovering never stutters
+AUDIO_BUFFER = 256  # Mixer buffer in samples, smaller starts sounds sooner but risks crackling on slow machines
 
 # Meters keys
 METER_CASH = "CompanyCash"
 METER_MORALE = "EmployeeMorale"
 METER_PROD = "EmployeeProductivity"
 METER_REP = "CompanyReputation"
+METERS = (METER_CASH, METER_MORALE, METER_PROD, METER_REP)  # Fixed order, used wherever meters are stored in arrays
 
 # Meters keys->shorthand
 METERS_SHORTHAND = {
@@ -54,6 +61,10 @@ FIRE_STEPS = {
     METER_REP: 60 / METER_CUTOFFS[METER_REP]         # 60
 }
 
+# The same two in METERS order
+CUTOFFS = tuple(METER_CUTOFFS[meter] for meter in METERS)
+STEPS = tuple(FIRE_STEPS[meter] for meter in METERS)
+
 TITLE_SCREEN_INSTRUCTIONS = "You are a CEO tasked with keeping your company afloat. You will be given prompts and \
 choices that affect your company's cash, morale, productivity, and reputation. At the end of each year, your Board of \
 Directors will evaluate your performance and decide on whether or not to keep you. For your first year, the Board will \
@@ -0,0 +1,208 @@
+import json
+import random
+import struct
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+from caching import IdentityCache, stale
+from consts import *
+from scenario_pack import PackEffects, ScenarioPack
+from selection import UniformSelector
+
+# The game's rules with nothing pygame related attached, so quarters can be played out programmatically (simulations,
+# tools, tests) without a display. GameState in main.py builds the screens on top of this.
+
+Scenario = Mapping[str, Union[str, Dict[str, int]]]
+Prefetched = Tuple[Any, Any, Any]  # (RNG state it was drawn from, result, RNG state after it)
+# (year, quarter, meters, meters_delta, button_mask, fired, current_indices), see GameEngine.snapshot()
+Snapshot = Tuple[int, int, Tuple[int, ...], Tuple[int, ...], int, bool, Tuple[int, ...]]
+
+# Serialized snapshots, all little-endian: magic, version, scenario count, year, quarter, button mask, fired, how many
+# scenarios are drawn (0 or 4), meters, meter deltas and the drawn scenarios' indices
+SAVE_MAGIC = b"ATBS"
+SAVE_VERSION = 2  # Version 1 stored the scenario count and indices in 16 bits, too few for big packs
+SAVE = struct.Struct("<4sBIHBB?B4h4h4I")
+
+# Scenarios only get loaded once per process, every game after the first shares them
+loaded_scenarios: Dict[Path, Sequence[Scenario]] = {}
+
+
+def load_scenarios(path: Path = ASSETS_DIR / "scenarios.json") -> Sequence[Scenario]:
+    if path not in loaded_scenarios:
+        # Prefer the compiled pack next to the JSON, as long as the JSON didn't change since the pack was built
+        pack_path = path.with_suffix(".pack")
+        if pack_path.exists() and not stale(pack_path, [path]):
+            loaded_scenarios[path] = ScenarioPack(pack_path)
+        else:
+            with path.open() as fp:
+                loaded_scenarios[path] = json.load(fp)
+    return loaded_scenarios[path]
+
+
+# Effect tables get built once per set of scenarios
+effect_tables = IdentityCache()
+
+
+def effect_table(scenarios: Sequence[Scenario]) -> Sequence[Tuple[int, ...]]:
+    # Every choice's meter changes as a tuple in METERS order, at scenario * 2 + choice. Packs read them straight out
+    # of the mapping instead, so a huge pack never gets turned into Python objects all at once.
+    def build() -> Sequence[Tuple[int, ...]]:
+        if isinstance(scenarios, ScenarioPack):
+            return PackEffects(scenarios)
+        return [tuple(scenario[results][meter] for meter in METERS)
+                for scenario in scenarios for results in (CHOICE_ONE_RESULTS, CHOICE_TWO_RESULTS)]
+
+    return effect_tables.get(scenarios, build)
+
+
+class GameEngine:
+    # Everything that makes up a game fits in a few ints and short lists: meters are indexed like METERS, the buttons
+    # are the bits of one int (button id = prompt * 2 + choice) and the scenarios on offer are indices into scenarios.
+    # That keeps snapshot() and restore() constant time, and a saved game a few dozen bytes.
+    __slots__ = ("year", "quarter", "meters", "meters_delta", "button_mask", "chance_of_being_fired", "fired",
+                 "scenarios", "effects", "current_indices", "selector", "rng", "prefetched_roll", "prefetched_draw")
+
+    def __init__(self, scenarios: Sequence[Scenario], rng: Optional[random.Random] = None, selector=None):
+        # Set initial values for game states
+        self.year = 1
+        self.quarter = 1
+        self.meters = [50] * len(METERS)
+        self.meters_delta = [0] * len(METERS)
+        self.button_mask = 0
+        self.chance_of_being_fired = self.get_fire_chance()
+        self.fired = False
+
+        # Scenarios to draw from, and the indices of the four on offer this quarter (none until they're drawn)
+        self.scenarios = scenarios
+        self.effects = effect_table(scenarios)
+        self.current_indices: Tuple[int, ...] = ()
+        # How they get drawn, see selection.py
+        self.selector = selector if selector is not None else UniformSelector(len(scenarios))
+
+        # Defaults to the random module itself, so random.seed() makes whole games reproducible
+        self.rng = rng if rng is not None else random
+
+        # Results of the next quarter's dice, worked out ahead of time by prefetch()
+        self.prefetched_roll: Optional[Prefetched] = None
+        self.prefetched_draw: Optional[Prefetched] = None
+
+    @property
+    def current_scenarios(self) -> List[Scenario]:
+        return [self.scenarios[i] for i in self.current_indices]
+
+    def draw_scenarios(self) -> List[Scenario]:
+        prefetched, self.prefetched_draw = self.prefetched_draw, None
+        self.current_indices = tuple(self.use_prefetched(prefetched, lambda: self.selector.draw(self, self.rng)))
+        return self.current_scenarios
+
+    # Works out what the next transition will roll and draw, without touching the RNG: the same calls get made on a
+    # copy of it. The results only get used if the RNG is still in the state they were drawn from when their turn
+    # comes, and then the RNG jumps to where drawing them for real would have left it. So the sequence of random
+    # numbers is the same as without prefetching, and a draw prefetched for a quarter the player gets fired before
+    # is never taken out of it. Returns the next quarter's scenarios, or None if the selector can't tell them yet.
+    def prefetch(self) -> Optional[List[Scenario]]:
+        ahead = random.Random(0)
+        ahead.setstate(self.rng.getstate())
+        self.prefetched_roll = None
+        if self.quarter == 4:  # The board review comes first
+            before = ahead.getstate()
+            roll = ahead.random()
+            self.prefetched_roll = (before, roll, ahead.getstate())
+        self.prefetched_draw = None
+        if not self.selector.predictable:
+            return None
+        before = ahead.getstate()
+        draw = self.selector.draw(self, ahead)
+        self.prefetched_draw = (before, draw, ahead.getstate())
+        return [self.scenarios[i] for i in draw]
+
+    def use_prefetched(self, prefetched: Optional[Prefetched], on_demand: Callable[[], Any]):
+        if prefetched is not None and self.rng.getstate() == prefetched[0]:
+            self.rng.setstate(prefetched[2])
+            return prefetched[1]
+        return on_demand()
+
+    def selected(self, button_id: int) -> bool:
+        return bool(self.button_mask >> button_id & 1)
+
+    def set_selected(self, button_id: int, state: bool):
+        if self.selected(button_id) != state:  # Only do work if we are actually changing our state
+            self.button_mask ^= 1 << button_id
+            effect = self.effects[self.current_indices[button_id >> 1] * 2 + (button_id & 1)]
+            sign = 1 if state else -1
+            for i, change in enumerate(effect):
+                self.meters_delta[i] += sign * change
+
+    # Picks a choice for one of the current scenarios: 0 for the left button, 1 for the right one, None for neither
+    def choose(self, prompt: int, choice: Optional[int]):
+        self.set_selected(prompt * 2, choice == 0)
+        self.set_selected(prompt * 2 + 1, choice == 1)
+
+    def end_quarter(self):
+        # Update the meters and reset the deltas
+        self.meters = [min(meter + delta, 100) for meter, delta in zip(self.meters, self.meters_delta)]
+        self.meters_delta = [0] * len(METERS)
+
+        self.chance_of_being_fired = self.get_fire_chance()  # Recalculate the chance to be fired
+        self.button_mask = 0  # Reset all the button states
+        self.current_indices = ()
+        # Move to the next quarter
+        self.quarter += 1
+        if self.quarter >= 5:
+            # Roll the dice!
+            prefetched, self.prefetched_roll = self.prefetched_roll, None
+            if self.use_prefetched(prefetched, self.rng.random) < self.chance_of_being_fired / 100 and self.year != 1:
+                self.fired = True
+            self.quarter = 1
+            self.year += 1
+
+    def get_fire_chance(self) -> float:
+        result = 0
+        for meter, cutoff, step in zip(self.meters, CUTOFFS, STEPS):
+            if meter < cutoff:
+                result += (cutoff - meter) * step
+            else:
+                result -= (meter - cutoff) * (step / 2)
+        return result
+
+    def ready_for_next_round(self) -> bool:
+        return bin(self.button_mask).count("1") == 4
+
+    # The whole game as a handful of immutable values, for forking it (solvers, simulations) or saving it. The RNG
+    # and the selector aren't part of it, a restored game carries on with whatever they come up with next.
+    def snapshot(self) -> Snapshot:
+        return (self.year, self.quarter, tuple(self.meters), tuple(self.meters_delta), self.button_mask, self.fired,
+                self.current_indices)
+
+    def restore(self, snapshot: Snapshot):
+        self.year, self.quarter, meters, meters_delta, self.button_mask, self.fired, self.current_indices = snapshot
+        self.meters = list(meters)
+        self.meters_delta = list(meters_delta)
+        self.chance_of_being_fired = self.get_fire_chance()  # The meters only change at the end of a quarter
+        self.prefetched_roll = None
+        self.prefetched_draw = None
+
+    def serialize(self) -> bytes:
+        indices = self.current_indices or (0,) * 4
+        return SAVE.pack(SAVE_MAGIC, SAVE_VERSION, len(self.scenarios), self.year, self.quarter, self.button_mask,
+                         self.fired, len(self.current_indices), *self.meters, *self.meters_delta, *indices)
+
+    def restore_serialized(self, data: bytes):
+        # Magic and version come first, so saves of other versions get told apart from ones that aren't saves at all
+        if len(data) < len(SAVE_MAGIC) + 1 or data[:len(SAVE_MAGIC)] != SAVE_MAGIC:
+            raise ValueError("Not a saved game")
+        version = data[len(SAVE_MAGIC)]
+        if version != SAVE_VERSION:
+            raise ValueError(f"Saved game version {version} is not supported, expected {SAVE_VERSION}")
+        if len(data) != SAVE.size:
+            raise ValueError("Saved game is corrupted")
+        fields = SAVE.unpack(data)
+        scenario_count, year, quarter, button_mask, fired, drawn = fields[2:8]
+        if scenario_count != len(self.scenarios):
+            raise ValueError("Saved game was played with other scenarios")
+        if drawn not in (0, 4):
+            raise ValueError("Saved game is corrupted")
+        meters = fields[8:12]
+        meters_delta = fields[12:16]
+        indices = fields[16:16 + drawn]
+        self.restore((year, quarter, meters, meters_delta, button_mask, fired, indices))
@@ -0,0 +1,68 @@
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+from pygame.font import Font, SysFont
+
+from consts import COMIC_SANS, VERDANA
+
+# Every (family, size) the game renders text with
+GAME_FONTS = (
+    (VERDANA, 16),     # Prompt buttons
+    (VERDANA, 20),     # Prompt text
+    (VERDANA, 24),     # Meters
+    (VERDANA, 28),     # Instructions and game over text
+    (COMIC_SANS, 24),  # Chance to be fired, game over summary
+    (COMIC_SANS, 36),  # Year and quarter
+    (COMIC_SANS, 72)   # Screen titles
+)
+
+
+class FontRegistry:
+    # Resolves each (family, size, bold, italic) through SysFont once and shares the resulting Font everywhere.
+    # SysFont goes through the system font lookup and opens the font file on every call, which is slow.
+    def __init__(self):
+        self.fonts: Dict[Tuple[str, int, bool, bool], Font] = {}
+        self.keys: Dict[Font, Tuple[str, int, bool, bool]] = {}  # Back from each Font to what it was resolved from
+        self.resolve_times: Dict[Tuple[str, int, bool, bool], float] = {}  # Seconds spent on each first resolution
+        self.hits = 0
+
+    def get(self, family: str, size: int, bold=False, italic=False) -> Font:
+        key = (family, size, bold, italic)
+        font = self.fonts.get(key)
+        if font is not None:
+            self.hits += 1
+            return font
+
+        start = perf_counter()
+        font = SysFont(family, size, bold, italic)
+        self.resolve_times[key] = perf_counter() - start
+        self.fonts[key] = font
+        self.keys[font] = key
+        return font
+
+    def scaled(self, font: Font, scale: float) -> Font:
+        # The same font at scale times its size, rasterized at that size instead of scaled after rendering
+        family, size, bold, italic = self.keys[font]
+        return self.get(family, max(1, round(size * scale)), bold, italic)
+
+    def warm_up(self, fonts=GAME_FONTS):
+        for family, size in fonts:
+            self.get(family, size)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": len(self.resolve_times),
+            "resolve_time": sum(self.resolve_times.values())
+        }
+
+    def overlay_lines(self) -> List[str]:
+        return [f"fonts  hits {self.hits}  resolved {len(self.resolve_times)} in "
+                f"{sum(self.resolve_times.values()) * 1000:.1f} ms"]
+
+
+font_registry = FontRegistry()
+
+
+def get_font(family: str, size: int, bold=False, italic=False) -> Font:
+    return font_registry.get(family, size, bold, italic)
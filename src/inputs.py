@@ -0,0 +1,97 @@
+from collections import deque
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pygame import Rect
+
+from metrics import latency_stats
+
+ClickHandler = Callable[[Any, Tuple[int, int]], Any]  # (gamestate, pos)
+HoverHandler = Callable[[bool], Any]                  # (hovered)
+
+
+class InputTarget:
+    __slots__ = ("rect", "handler")
+
+    def __init__(self, rect: Rect, handler: Callable):
+        self.rect = rect
+        self.handler = handler
+
+
+class InputRouter:
+    # Routes mouse input to the handlers the current screen registered. Targets are bucketed into a coarse grid over
+    # the screen when the screen gets built, so finding what is under the mouse only looks at the handful of targets
+    # in one cell instead of testing every sprite.
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.click_cells: Dict[Tuple[int, int], List[InputTarget]] = {}
+        self.hover_cells: Dict[Tuple[int, int], List[InputTarget]] = {}
+        self.hover_targets: List[InputTarget] = []
+        self.hovered: List[InputTarget] = []  # Hover targets currently under the mouse
+
+        # Time from pulling a mouse motion off the queue to showing the frame with its hover states, in seconds
+        self.motion_received: Optional[float] = None
+        self.latencies = deque(maxlen=600)
+
+    def clear(self):
+        self.click_cells.clear()
+        self.hover_cells.clear()
+        self.hover_targets.clear()
+        self.hovered.clear()
+
+    def add_click(self, rect: Rect, handler: ClickHandler):
+        self.add(self.click_cells, InputTarget(rect, handler))
+
+    def add_hover(self, rect: Rect, handler: HoverHandler):
+        target = InputTarget(rect, handler)
+        self.add(self.hover_cells, target)
+        self.hover_targets.append(target)
+
+    def add(self, cells: Dict[Tuple[int, int], List[InputTarget]], target: InputTarget):
+        size = self.cell_size
+        for x in range(target.rect.left // size, (target.rect.right - 1) // size + 1):
+            for y in range(target.rect.top // size, (target.rect.bottom - 1) // size + 1):
+                cells.setdefault((x, y), []).append(target)
+
+    def targets_at(self, cells: Dict[Tuple[int, int], List[InputTarget]], pos: Tuple[int, int]) -> List[InputTarget]:
+        cell = cells.get((pos[0] // self.cell_size, pos[1] // self.cell_size), ())
+        return [target for target in cell if target.rect.collidepoint(pos)]
+
+    def click(self, gamestate, pos: Tuple[int, int]):
+        # Find every target first, a handler might rebuild the screen and with it this router
+        for target in self.targets_at(self.click_cells, pos):
+            target.handler(gamestate, pos)
+
+    def hover(self, pos: Tuple[int, int], received: Optional[float] = None):
+        # Only targets the mouse entered or left hear about it
+        hovered = self.targets_at(self.hover_cells, pos)
+        for target in self.hovered:
+            if target not in hovered:
+                target.handler(False)
+        for target in hovered:
+            if target not in self.hovered:
+                target.handler(True)
+        self.hovered = hovered
+
+        if received is not None and self.motion_received is None:
+            self.motion_received = received
+
+    def sync(self, pos: Tuple[int, int]):
+        # Set every hover target from scratch, for freshly built screens
+        self.hovered = self.targets_at(self.hover_cells, pos)
+        for target in self.hover_targets:
+            target.handler(target in self.hovered)
+
+    def frame_presented(self):
+        if self.motion_received is not None:
+            self.latencies.append(perf_counter() - self.motion_received)
+            self.motion_received = None
+
+    def latency_stats(self) -> Dict[str, float]:
+        return latency_stats(self.latencies)
+
+    def overlay_lines(self) -> List[str]:
+        stats = self.latency_stats()
+        if not stats:
+            return []
+        return [f"mouse to hover ms  mean {stats['mean'] * 1000:.1f}  p95 {stats['p95'] * 1000:.1f}"]
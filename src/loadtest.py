@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict, List, Tuple
+
+from consts import *
+from metrics import percentile
+from selection import SELECTOR_NAMES
+
+# Load test for server.py. Opens a number of sessions over a number of connections, then has every session play
+# random choices until it's fired or has played its quarters, and reports:
+#   - how many sessions the process held, and how many it could keep up with at one request every --think seconds
+#   - request latency, from sending a request to reading its response, p50 and p99
+#   - memory per session, from how much the server's resident memory grew while the sessions got opened
+#
+# The server runs in a process of its own, started here unless --connect points at one that's already running.
+# Session seeds count up from --seed, so two runs play the same games.
+
+Address = Tuple[str, int]
+
+
+class Client:
+    # One connection speaking JSON lines, requests go one at a time
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, latencies: List[float]):
+        self.reader = reader
+        self.writer = writer
+        self.latencies = latencies
+
+    @classmethod
+    async def connect(cls, address: Address, latencies: List[float]) -> "Client":
+        reader, writer = await asyncio.open_connection(*address)
+        return cls(reader, writer, latencies)
+
+    async def request(self, **request) -> Dict[str, Any]:
+        start = perf_counter()
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        response = json.loads(await self.reader.readline())
+        self.latencies.append(perf_counter() - start)
+        if "error" in response:
+            raise RuntimeError(f"{request['op']}: {response['error']}")
+        return response
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def open_sessions(client: Client, seeds: List[int], draws: str) -> List[str]:
+    return [(await client.request(op="new", seed=seed, draws=draws))["session"] for seed in seeds]
+
+
+async def play(client: Client, sessions: List[str], quarters: int, rng: random.Random) -> int:
+    # Plays every session a quarter at a time, taking turns, so they all stay open for the whole test. Returns how
+    # many quarters got played.
+    played = 0
+    running = list(sessions)
+    for _ in range(quarters):
+        still_running = []
+        for session in running:
+            for prompt in range(4):
+                await client.request(op="choose", session=session, prompt=prompt, choice=rng.randrange(2))
+            state = await client.request(op="next_quarter", session=session)
+            played += 1
+            if not state["fired"]:
+                still_running.append(session)
+        running = still_running
+    return played
+
+
+async def run(args: argparse.Namespace, address: Address) -> Dict[str, Any]:
+    setup_latencies: List[float] = []
+    latencies: List[float] = []
+    clients = [await Client.connect(address, setup_latencies) for _ in range(args.connections)]
+    before = (await clients[0].request(op="stats"))["resident_bytes"]
+
+    # Sessions get dealt out over the connections
+    seeds = [[args.seed + i for i in range(n, args.sessions, args.connections)] for n in range(args.connections)]
+    start = perf_counter()
+    sessions = await asyncio.gather(*(open_sessions(client, client_seeds, args.draws)
+                                      for client, client_seeds in zip(clients, seeds)))
+    open_time = perf_counter() - start
+    stats = await clients[0].request(op="stats")
+
+    for client in clients:
+        client.latencies = latencies
+    start = perf_counter()
+    played = await asyncio.gather(*(play(client, client_sessions, args.quarters, random.Random(args.seed + n))
+                                    for n, (client, client_sessions) in enumerate(zip(clients, sessions))))
+    play_time = perf_counter() - start
+
+    for client, client_sessions in zip(clients, sessions):
+        for session in client_sessions:
+            await client.request(op="close", session=session)
+        await client.close()
+
+    latencies.sort()
+    requests_per_second = len(latencies) / play_time
+    grown = stats["resident_bytes"] - before if before is not None and stats["resident_bytes"] is not None else None
+    return {
+        "sessions": stats["sessions"],
+        "connections": args.connections,
+        "sessions_opened_per_second": args.sessions / open_time,
+        "quarters_played": sum(played),
+        "requests": len(latencies),
+        "requests_per_second": requests_per_second,
+        "sessions_per_process": int(requests_per_second * args.think),  # At one request per player every --think s
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "bytes_per_session": grown / args.sessions if grown is not None else None
+    }
+
+
+def start_server(args: argparse.Namespace) -> Tuple[subprocess.Popen, Address]:
+    server = subprocess.Popen([sys.executable, str(Path(__file__).with_name("server.py")), "--port", "0",
+                               "--scenarios", str(args.scenarios), "--max-sessions", str(max(args.sessions, 1))],
+                              stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()  # "Serving JSON lines on host:port"
+    if not line:
+        sys.exit("The server didn't start")
+    host, _, port = line.split()[-1].rpartition(":")
+    return server, (host, int(port))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test server.py with many sessions playing at once")
+    parser.add_argument("--sessions", type=int, default=10_000, help="sessions to open and keep playing")
+    parser.add_argument("--connections", type=int, default=50, help="connections to spread the sessions over")
+    parser.add_argument("--quarters", type=int, default=8, help="quarters for every session to play, unless fired")
+    parser.add_argument("--draws", choices=SELECTOR_NAMES, default="random", help="how sessions draw scenarios")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first session, the rest count up from it")
+    parser.add_argument("--think", type=float, default=5.0, metavar="SECONDS",
+                        help="time a player takes between requests, for working out sessions per process")
+    parser.add_argument("--scenarios", type=Path, default=ASSETS_DIR / "scenarios.json", help="scenarios JSON or pack")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="test a server that's already running (JSON lines)")
+    parser.add_argument("--json", type=Path, metavar="FILE", help="write the results to FILE")
+    args = parser.parse_args()
+    if args.sessions < 1 or args.connections < 1 or args.quarters < 1:
+        parser.error("--sessions, --connections and --quarters have to be at least 1")
+    args.connections = min(args.connections, args.sessions)
+
+    server = None
+    if args.connect:
+        host, _, port = args.connect.rpartition(":")
+        address = (host, int(port))
+    else:
+        server, address = start_server(args)
+    try:
+        results = asyncio.run(run(args, address))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(f"{results['sessions']} sessions over {results['connections']} connections, "
+          f"{results['quarters_played']} quarters played")
+    print(f"{results['requests_per_second']:.0f} requests/s, enough for {results['sessions_per_process']} "
+          f"sessions per process at one request every {args.think:g}s")
+    print(f"Latency p50 {results['latency_p50_ms']:.2f} ms, p99 {results['latency_p99_ms']:.2f} ms")
+    if results["bytes_per_session"] is not None:
+        print(f"Memory per session: {results['bytes_per_session'] / 1024:.1f} KiB")
+    if args.json:
+        with args.json.open("w") as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
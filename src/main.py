@@ -1,217 +1,445 @@
+from startup import DeferredLoader, startup_trace  # First, so the startup trace's clock starts before everything else
+
+import argparse
 import enum
-import json
 import random
+from pathlib import Path
+from time import perf_counter
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 import pygame
-from pygame.event import Event
-from pygame.locals import MOUSEBUTTONUP, MOUSEMOTION, QUIT
+from pygame.event import custom_type, Event
+from pygame.locals import FULLSCREEN, K_F3, KEYDOWN, MOUSEBUTTONUP, MOUSEMOTION, QUIT
 
+from assets import asset_cache, CONVERT, load_image
+from atlas import load_atlas
+from audio import audio
 from consts import *
-from sprites import GenericButton, Meter, MuteButton, NextRound, Prompt, TextArea, TextAreaWrapped, Title
-
-
-class GameState:
+from engine import GameEngine, load_scenarios, Scenario
+from fonts import font_registry, get_font
+from inputs import InputRouter
+from preloader import AssetPreloader, LoadingIndicator, screen_priorities
+from profiler import frame_profiler, ProfilerOverlay, timed
+from render import Renderer
+from replay import choice_event, InputRecorder, NEW_GAME, NEXT_QUARTER, TOGGLE_MUTE
+from saves import Autosaver, load_save
+from scaling import mouse_pos, scale_display, to_logical
+from scheduler import FrameScheduler
+from screens import screen_cache
+from selection import make_selector, scenario_index, SELECTOR_NAMES
+from sprites import GenericButton, load_click_sound, Meter, MuteButton, NextRound, Prompt, SCREEN_IMAGES, SOUNDS, \
+    TextArea, TextAreaWrapped, Title
+
+NEWGAME = custom_type()
+scenario_draws = "random"  # How every game draws its scenarios, one of selection.SELECTOR_NAMES
+
+
+class GameplayScreen:
+    # The gameplay screen's sprites. They get built once and then updated for every quarter of every game: the meters
+    # and buttons read the game they're drawn for anyway, and the four prompts get re-skinned with the new scenarios
+    # instead of being rebuilt, their PromptChoice buttons included.
+    def __init__(self, scenarios: List[Scenario]):
+        # Build meters
+        self.meters = [
+            Meter((10, 385), METER_CASH, "Company Cash", "cash.png"),
+            Meter((10, 470), METER_MORALE, "Employee Morale", "morale.png"),
+            Meter((10, 555), METER_PROD, "Employee Productivity", "productivity.png"),
+            Meter((10, 640), METER_REP, "Company Reputation", "reputation.png")
+        ]
+
+        # Build Prompts
+        self.prompts = [Prompt(y_pos, i * 2, scenario) for i, (y_pos, scenario) in enumerate(zip(PROMPT_Y_POSITIONS,
+                                                                                                  scenarios))]
+
+        # Build text areas, their text gets set for each quarter
+        self.round_text = TextArea("", 36, topleft=(20, 10))
+        self.ctbf_text = TextArea("", 24, topleft=(10, 330))
+
+        # Build NextRound and mute buttons
+        self.next_round = NextRound()
+        self.mute_button = MuteButton((10, 260))
+
+        # Everything that's drawn, and everything that takes mouse input
+        self.sprites = pygame.sprite.Group(*self.meters, *self.prompts, self.round_text, self.ctbf_text,
+                                           self.next_round, self.mute_button)
+        self.interactive = [*self.prompts, self.next_round, self.mute_button]
+
+    def prerender(self, scenarios: List[Scenario]) -> Iterator[None]:
+        for prompt, scenario in zip(self.prompts, scenarios):
+            yield from prompt.prerender(scenario)
+
+    def show(self, game: GameEngine, scenarios: List[Scenario]):
+        for prompt, scenario in zip(self.prompts, scenarios):
+            prompt.reskin(scenario)
+        self.round_text.set_text(f"Y{game.year} Q{game.quarter}")
+        self.ctbf_text.set_text(f"Chance to be fired: {sorted((0, game.chance_of_being_fired, 100))[1]:.0f}%")
+
+
+class GameState(GameEngine):
     class States(enum.Enum):
         TITLE_SCREEN = enum.auto()
         INSTRUCTIONS = enum.auto()
         GAMEPLAY = enum.auto()
         GAME_OVER = enum.auto()
 
-    def __init__(self, state: States, muted: bool):
-        # Set initial values for game states
-        self.year = 1
-        self.quarter = 1
-        self.meters = {
-            METER_CASH: 50,
-            METER_MORALE: 50,
-            METER_PROD: 50,
-            METER_REP: 50
-        }
-        self.meters_delta = {
-            METER_CASH: 0,
-            METER_MORALE: 0,
-            METER_PROD: 0,
-            METER_REP: 0
-        }
-        self.button_states = [False] * 8
+    def __init__(self, state: States, muted: bool, recorder: Optional[InputRecorder] = None,
+                 autosaver: Optional[Autosaver] = None, router: Optional[InputRouter] = None):
+        # Load the scenarios in and set initial values for game states
+        scenarios = load_scenarios()
+        super().__init__(scenarios, selector=make_selector(scenario_draws, len(scenarios)))
         self.screen_state = state
-        self.chance_of_being_fired = self.get_fire_chance()
         self.muted = muted
-
-        # Load the scenarios in
-        with (ASSETS_DIR / "scenarios.json").open() as fp:
-            self.scenarios = json.load(fp)
+        self.recorder = recorder  # Logs the player's inputs, if the session is being recorded
+        self.autosaver = autosaver  # Saves the game every quarter, if there's somewhere to save it
 
         # Build the initial screen
         self.all_sprites = pygame.sprite.Group()
+        self.background: Optional[pygame.Surface] = None  # The screen's background, static sprites included
+        # Mouse handlers of the sprites on screen, registered in build_screen. A new game takes over the last one's,
+        # so the latencies it tracks carry over.
+        self.input = router if router is not None else InputRouter()
+        self.input_screen: Optional[GameState.States] = None  # Screen the handlers were registered for
+        self.background_work: Optional[Iterator[None]] = None  # Steps of work to do in idle frame time
+        self.screen_version = 0  # Bumped on every rebuild so the renderer knows to redraw everything
         self.build_screen()
 
     def transition_state(self, new_state: States):
         self.screen_state = new_state
         self.build_screen()
 
+    @timed(lambda self: f"build_screen {self.screen_state.name}")
     def build_screen(self):
-        self.all_sprites.empty()
+        self.screen_version += 1
+        self.background_work = None
         if self.screen_state == GameState.States.TITLE_SCREEN:
-            title = Title()
+            # Title screen, the title itself never changes so it lives in the background layer
+            self.background = screen_cache.layer(self.screen_state, load_image(ASSETS_DIR / "background.png"),
+                                                 lambda: [Title()], self)
             start_game_button = GenericButton((528, 600), "play",
                                               lambda: self.transition_state(GameState.States.INSTRUCTIONS))
             mute_button = MuteButton((10, 10))
 
-            self.all_sprites.add(title, start_game_button, mute_button)
+            self.all_sprites = pygame.sprite.Group(start_game_button, mute_button)
+            self.register_input(start_game_button, mute_button)
 
-            if not self.muted and not pygame.mixer.music.get_busy():
-                pygame.mixer.music.play(loops=-1)  # Loop forever
+            self.play_music()
         elif self.screen_state == GameState.States.INSTRUCTIONS:
-            instructions_font = pygame.font.SysFont(VERDANA, 28)
-            title = TextArea("Instructions", 72, center=(640, 125))
-            instructions = TextAreaWrapped(pygame.Rect(280, 200, 720, 350), TITLE_SCREEN_INSTRUCTIONS,
-                                           instructions_font, FONT_COLOR)
+            def build_static():
+                instructions_font = get_font(VERDANA, 28)
+                title = TextArea("Instructions", 72, center=(640, 125))
+                instructions = TextAreaWrapped(pygame.Rect(280, 200, 720, 350), TITLE_SCREEN_INSTRUCTIONS,
+                                               instructions_font, FONT_COLOR)
+                return [title, instructions]
+            self.background = screen_cache.layer(self.screen_state, load_image(ASSETS_DIR / "background.png"),
+                                                 build_static, self)
             start_game_button = GenericButton((528, 600), "play",
                                               lambda: self.transition_state(GameState.States.GAMEPLAY))
 
             mute_button = MuteButton((10, 10))
-            self.all_sprites.add(title, instructions, start_game_button, mute_button)
+            self.all_sprites = pygame.sprite.Group(start_game_button, mute_button)
+            self.register_input(start_game_button, mute_button)
 
-            if not self.muted and not pygame.mixer.music.get_busy():
-                pygame.mixer.music.play(loops=-1)  # Loop forever
+            self.play_music()
         elif self.screen_state == GameState.States.GAMEPLAY:
-            # Build meters
-            cash_meter = Meter((10, 385), METER_CASH, "Company Cash", "cash.png")
-            morale_meter = Meter((10, 470), METER_MORALE, "Employee Morale", "morale.png")
-            productivity_meter = Meter((10, 555), METER_PROD, "Employee Productivity", "productivity.png")
-            reputation_meter = Meter((10, 640), METER_REP, "Company Reputation", "reputation.png")
-
-            # Select scenarios
-            four_scenarios = random.sample(self.scenarios, 4)
-
-            # Build Prompts
-            prompt_1 = Prompt(10, 0, four_scenarios[0])
-            prompt_2 = Prompt(189, 2, four_scenarios[1])
-            prompt_3 = Prompt(366, 4, four_scenarios[2])
-            prompt_4 = Prompt(543, 6, four_scenarios[3])
-
-            # Build text areas
-            round_text = TextArea(f"Y{self.year} Q{self.quarter}", 36, topleft=(20, 10))
-            ctbf_text = TextArea(f"Chance to be fired: {sorted((0, self.chance_of_being_fired, 100))[1]:.0f}%", 24,
-                                 topleft=(10, 330))
-
-            # Build NextRound Button
-            next_round = NextRound()
-
-            # Mute button
-            mute_button = MuteButton((10, 260))
-
-            # Add all sprites to the main group
-            self.all_sprites.add(cash_meter, morale_meter, productivity_meter, reputation_meter,
-                                 prompt_1, prompt_2, prompt_3, prompt_4,
-                                 round_text, ctbf_text, next_round, mute_button)
+            # Select scenarios, unless a saved game brought its own
+            four_scenarios = self.current_scenarios if self.current_indices else self.draw_scenarios()
+            self.save()
+
+            # Every quarter of every game shows the same sprites, just with other scenarios and numbers
+            gameplay = screen_cache.part(self.screen_state, lambda: GameplayScreen(four_scenarios))
+            gameplay.show(self, four_scenarios)
+            self.background = load_image(ASSETS_DIR / "background.png")
+            self.all_sprites = gameplay.sprites
+            if self.input_screen != self.screen_state:  # Nothing moves between quarters, the handlers can stay
+                self.register_input(*gameplay.interactive)
+
+            # Get the next quarter ready while the player thinks this one over, if it can be known already
+            next_scenarios = self.prefetch()
+            self.background_work = gameplay.prerender(next_scenarios) if next_scenarios is not None else None
 
             # Play the music
-            if not self.muted and not pygame.mixer.music.get_busy():
-                pygame.mixer.music.play(loops=-1)  # Loop forever
+            self.play_music()
         elif self.screen_state == GameState.States.GAME_OVER:
             prompt_1 = TextArea("Game Over", 72, center=(640, 210))
 
             prompt_2_text = f"You made it {self.year - 1} year(s) and had a {sorted((0, self.chance_of_being_fired, 100))[1]:.0f}% chance of being fired."
             prompt_2 = TextArea(prompt_2_text, 24, center=(640, 270))
 
-            text_font = pygame.font.SysFont(VERDANA, 28)
+            text_font = get_font(VERDANA, 28)
             description = TextAreaWrapped(pygame.Rect(280, 310, 720, 150), GAME_OVER_FLAVORTEXT,
                                           text_font, FONT_COLOR, centered=True)
 
             play_again = GenericButton((350, 485), "playagain", lambda: pygame.event.post(Event(NEWGAME)))
             exit_btn = GenericButton((700, 485), "exit", lambda: pygame.event.post(Event(QUIT)))
 
-            self.all_sprites.add(prompt_1, prompt_2, description, play_again, exit_btn)
+            self.background = load_image(ASSETS_DIR / "background.png")
+            self.all_sprites = pygame.sprite.Group(prompt_1, prompt_2, description, play_again, exit_btn)
+            self.register_input(play_again, exit_btn)
+            self.save()  # A lost game is nothing to carry on with next time
+
+            audio.stop_music()
+
+        # Hover states start out matching wherever the mouse already is
+        self.input.sync(mouse_pos())
 
-            pygame.mixer.music.pause()
-            pygame.mixer.music.rewind()
+    def register_input(self, *sprites):
+        self.input.clear()
+        for sprite in sprites:
+            sprite.register_input(self.input)
+        self.input_screen = self.screen_state
 
+    def choose(self, prompt: int, choice: Optional[int]):
+        if self.recorder is not None:
+            self.recorder.record(choice_event(prompt, choice))
+        super().choose(prompt, choice)
+
+    @timed("transition_round")
     def transition_round(self):
-        # Update the meters and reset the deltas
-        for meter in self.meters:
-            self.meters[meter] = min(self.meters[meter] + self.meters_delta[meter], 100)
-            self.meters_delta[meter] = 0
-
-        self.chance_of_being_fired = self.get_fire_chance()  # Recalculate the chance to be fired
-        self.button_states = [False] * 8  # Reset all the button states
-        # Move to the next quarter
-        self.quarter += 1
-        if self.quarter >= 5:
-            # Roll the dice!
-            if random.random() < self.chance_of_being_fired / 100 and self.year != 1:
-                self.screen_state = GameState.States.GAME_OVER
-            self.quarter = 1
-            self.year += 1
+        if self.recorder is not None:
+            self.recorder.record(NEXT_QUARTER)
+        self.end_quarter()
+        if self.fired:
+            self.screen_state = GameState.States.GAME_OVER
         # Setup the next screen, whichever one that might be
         self.build_screen()
 
-    def get_fire_chance(self) -> float:
-        result = 0
-        for meter in self.meters:
-            if self.meters[meter] < METER_CUTOFFS[meter]:
-                result += (METER_CUTOFFS[meter] - self.meters[meter]) * FIRE_STEPS[meter]
-            else:
-                result -= (self.meters[meter] - METER_CUTOFFS[meter]) * (FIRE_STEPS[meter] / 2)
-        return result
+    def save(self):
+        if self.autosaver is not None:
+            self.autosaver.save(self.serialize())
+
+    def do_background_work(self, budget: float):
+        # Works through background_work until it's done or budget seconds are up
+        deadline = perf_counter() + budget
+        while self.background_work is not None and perf_counter() < deadline:
+            if next(self.background_work, StopIteration) is StopIteration:
+                self.background_work = None
 
-    def ready_for_next_round(self) -> bool:
-        return self.button_states.count(True) == 4
+    def play_music(self):
+        if not self.muted:
+            audio.play_music()
 
     def toggle_mute(self):
+        if self.recorder is not None:
+            self.recorder.record(TOGGLE_MUTE)
         self.muted = not self.muted
         if self.muted:
-            pygame.mixer.music.pause()
+            audio.pause_music()
         else:
-            pygame.mixer.music.unpause()
+            audio.unpause_music()
 
     def draw(self, screen):
         for sprite in self.all_sprites:
-            sprite.draw(screen, self)
+            with frame_profiler.section(type(sprite).__name__):
+                sprite.draw(screen, self)
+
 
+def load_music(game: GameState):
+    audio.load_music(ASSETS_DIR / "sounds" / "background.ogg", 0.20)
 
-# Init pygame and the screen
-pygame.init()
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-icon = pygame.image.load(ASSETS_DIR / "icon.png")
-pygame.display.set_icon(icon)
+    # Pick up where the music would be had it been loaded from the start: playing everywhere but the game over screen,
+    # paused if the player muted the game in the meantime
+    if game.screen_state != GameState.States.GAME_OVER:
+        audio.play_music()
+        if game.muted:
+            audio.pause_music()
 
-# Setup background music
-pygame.mixer.music.load(ASSETS_DIR / "sounds" / "background.ogg")
-pygame.mixer.music.set_volume(0.20)
 
-# Make the game
-game = GameState(GameState.States.TITLE_SCREEN, False)
+def preload_screens(preloader: AssetPreloader, current: GameState.States):
+    # The current screen's images go first, then the screens after it in the order the game usually gets to them
+    priorities = screen_priorities([state.name for state in GameState.States], current.name)
+    for screen, priority in priorities.items():
+        preloader.request_all(SCREEN_IMAGES[screen], priority)
 
-# Setup the clock that will be used to cap the framerate
-clock = pygame.time.Clock()
 
-running = True
-while running:
-    # Event Handling
-    for event in pygame.event.get():
+def handle_events(game: GameState, overlay: Optional[ProfilerOverlay] = None,
+                  events: Optional[Iterable[Event]] = None) -> Tuple[bool, GameState]:
+    # Handles events, everything on the event queue by default. Returns whether to keep running and the game to carry
+    # on with.
+    running = True
+    motion_pos = None       # Only the latest mouse position of the frame matters for hovering
+    motion_received = None  # When the first motion event of the frame came off the queue
+    for event in pygame.event.get() if events is None else events:
         if event.type == QUIT:
             running = False
         elif event.type == NEWGAME:
-            game = GameState(GameState.States.GAMEPLAY, game.muted)
+            if game.recorder is not None:
+                game.recorder.record(NEW_GAME)
+            game = GameState(GameState.States.GAMEPLAY, game.muted, game.recorder, game.autosaver, game.input)
         elif event.type == MOUSEBUTTONUP and event.button == MOUSE_LEFT_CLICK:
-            clicked_sprites = [s for s in game.all_sprites if s.rect.collidepoint(event.pos)]
-            for sprite in clicked_sprites:
-                if hasattr(sprite, "handle_click"):
-                    sprite.handle_click(game, event.pos)
+            audio.click_received()
+            game.input.click(game, to_logical(event.pos))
         elif event.type == MOUSEMOTION:
-            for sprite in game.all_sprites:
-                if hasattr(sprite, "hovered"):
-                    sprite.hovered = sprite.rect.collidepoint(event.pos)
-                elif hasattr(sprite, "handle_hover"):
-                    sprite.handle_hover(event.pos)
-
-    # Drawing
-    bg_surf = pygame.image.load(ASSETS_DIR / "background.png").convert()
-    screen.blit(bg_surf, bg_surf.get_rect())
-    game.draw(screen)      # Draw...everything
-    pygame.display.flip()  # Show the frame
-
-    # Wait until next frame
-    clock.tick(60)  # Lock at 60 FPS
+            motion_pos = to_logical(event.pos)
+            if motion_received is None:
+                motion_received = perf_counter()
+        elif event.type == KEYDOWN and event.key == K_F3 and overlay is not None:
+            overlay.toggle()
+    if motion_pos is not None:
+        game.input.hover(motion_pos, motion_received)
+    return running, game
+
+
+def parse_resolution(value: str) -> Tuple[int, int]:
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, like 1920x1080, not {value!r}")
+    if width < 1 or height < 1:
+        raise argparse.ArgumentTypeError(f"{value!r} has no pixels")
+    return width, height
+
+
+def main():
+    global scenario_draws
+    parser = argparse.ArgumentParser(description="Appeasing the Board")
+    parser.add_argument("--profile", action="store_true", help="time every part of the frame, F3 toggles the overlay")
+    parser.add_argument("--profile-trace", type=Path, metavar="FILE",
+                        help="also stream timings to FILE, Chrome trace format for .json and CSV otherwise")
+    parser.add_argument("--startup-trace", type=Path, metavar="FILE",
+                        help="write how long each step of startup took to FILE as JSON when the game exits")
+    parser.add_argument("--seed", type=int, help="seed the game's random numbers, to play a session again")
+    parser.add_argument("--record", type=Path, metavar="FILE",
+                        help="record the session to FILE, for replaying it with replay.py")
+    parser.add_argument("--draws", choices=SELECTOR_NAMES, default="random",
+                        help="how scenarios get drawn: at random, off a shuffled deck without repeats, or leaning "
+                             "toward the weakest meter without repeats")
+    parser.add_argument("--audio-buffer", type=int, default=AUDIO_BUFFER, metavar="SAMPLES",
+                        help="mixer buffer size, lower for less delay on sounds if the machine keeps up, see --profile")
+    parser.add_argument("--save", type=Path, metavar="FILE",
+                        help="save the game to FILE every quarter, and carry on from there next time")
+    parser.add_argument("--resolution", type=parse_resolution, metavar="WxH",
+                        help=f"window size, the game gets scaled to fit it (default {SCREEN_WIDTH}x{SCREEN_HEIGHT})")
+    parser.add_argument("--fullscreen", action="store_true",
+                        help="fill the display, at its own resolution unless --resolution says otherwise")
+    args = parser.parse_args()
+
+    if args.seed is not None and not 0 <= args.seed < 2 ** 64:
+        parser.error("--seed has to fit in 64 bits, and can't be negative")
+    if args.audio_buffer < 1:
+        parser.error("--audio-buffer has to be at least 1 sample")
+
+    # Recordings need to know the seed, so pick one instead of leaving it to the random module
+    seed = args.seed
+    if seed is None and args.record:
+        seed = random.getrandbits(64)
+    if seed is not None:
+        random.seed(seed)
+    scenario_draws = args.draws
+    recorder = InputRecorder(args.record, seed, scenario_draws) if args.record else None
+    if args.profile or args.profile_trace:
+        frame_profiler.enable(args.profile_trace)
+
+    startup_trace.mark("imports")
+
+    # Init pygame and the screen
+    audio.pre_init(args.audio_buffer)
+    pygame.init()
+    audio.start()
+    startup_trace.mark("pygame.init")
+    icon = pygame.image.load(ASSETS_DIR / "icon.png")
+    pygame.display.set_icon(icon)
+    if args.fullscreen:
+        display = pygame.display.set_mode(args.resolution or (0, 0), FULLSCREEN)  # (0, 0) is the desktop's size
+    else:
+        display = pygame.display.set_mode(args.resolution or (SCREEN_WIDTH, SCREEN_HEIGHT))
+    screen = scale_display(display)  # Everything gets drawn in SCREEN_WIDTH x SCREEN_HEIGHT coordinates on this
+    startup_trace.mark("display")
+
+    # The UI images come out of one memory-mapped texture atlas when the build packed them into one
+    atlas = load_atlas()
+    if atlas is not None:
+        asset_cache.add_atlas(atlas.surface, atlas.mode, atlas.regions)
+        startup_trace.mark("atlas")
+
+    # Decode every image and sound on worker threads, the title screen's first. Whatever the title screen needs
+    # before the workers get to it gets loaded on the spot.
+    preloader = AssetPreloader()
+    asset_cache.decoder = preloader.take
+    preloader.request(ASSETS_DIR / "background.png", CONVERT, 0)
+    preload_screens(preloader, GameState.States.TITLE_SCREEN)
+    preloader.request_all(SOUNDS, 1)
+    preloaded_for = GameState.States.TITLE_SCREEN
+
+    # Make the game, starting on the title screen. A saved game picks up once the player gets past the instructions,
+    # except in recorded sessions: those have to start from scratch to replay.
+    autosaver = Autosaver(args.save) if args.save else None
+    game = GameState(GameState.States.TITLE_SCREEN, False, recorder, autosaver)
+    saved = load_save(args.save, game.scenarios) if args.save and recorder is None else None
+    if saved is not None:
+        game.restore(saved)
+    startup_trace.mark("title screen")
+
+    # Everything else the title screen doesn't need waits until it's up, then loads one piece per frame. Jobs look up
+    # game when they run, a new game might have started by then.
+    loader = DeferredLoader()
+    loader.add("fonts", font_registry.warm_up)  # Resolve every font before the first screen that needs it
+    loader.add("music", lambda: load_music(game))
+    loader.add("click sound", load_click_sound)
+    if scenario_draws == "weakest":  # Index the scenarios before the first draw needs them
+        loader.add("scenario index", lambda: scenario_index(game))
+
+    # Frames come at the full rate while anything changes, otherwise the loop sleeps until the next event
+    scheduler = FrameScheduler()
+
+    # Setup the renderer, each screen brings its own background
+    renderer = Renderer(screen, DIRTY_RECT_RENDERING)
+    overlay = None
+    if frame_profiler.enabled:
+        overlay = ProfilerOverlay(frame_profiler, extra=lambda: (game.input.overlay_lines() + audio.overlay_lines()
+                                                                 + scheduler.overlay_lines()
+                                                                 + asset_cache.overlay_lines()
+                                                                 + font_registry.overlay_lines()))
+        renderer.overlays.append(overlay)
+    renderer.overlays.append(LoadingIndicator(preloader))
+
+    # Shutting down happens however the loop ends, so a crash still leaves a complete recording and save behind
+    try:
+        running = True
+        while running:
+            frame_profiler.begin_frame()
+
+            # Event Handling
+            with frame_profiler.section("events"):
+                running, game = handle_events(game, overlay, scheduler.events())
+
+            # Drawing
+            drew = renderer.render(game, game.background)  # Draw whatever changed and show the frame
+            game.input.frame_presented()
+            startup_trace.frame_presented()
+
+            # Load whatever is left over, a bit at a time
+            with frame_profiler.section("deferred loading"):
+                if game.screen_state != preloaded_for:
+                    preloaded_for = game.screen_state
+                    preload_screens(preloader, preloaded_for)
+                if not preloader.done():
+                    preloader.process()
+                    if preloader.done():
+                        startup_trace.mark("assets preloaded")
+                loader.run_next()
+            audio.run_music_commands()
+            with frame_profiler.section("background work"):
+                game.do_background_work(BACKGROUND_WORK_BUDGET)
+
+            # Wait until next frame, or until something happens if nothing is changing or still loading. Never sleep on
+            # the way out.
+            busy = (not running or drew or game.background_work is not None or not loader.done() or not preloader.done()
+                    or bool(audio.music_commands))
+            with frame_profiler.section("tick"):
+                scheduler.end_frame(busy)
+            frame_profiler.end_frame()
+    finally:
+        preloader.close()
+        if frame_profiler.enabled:
+            print(f"Frames: {scheduler.report()}")
+        frame_profiler.close()
+        if recorder is not None:
+            recorder.close()
+        if autosaver is not None:
+            autosaver.close()
+        if args.startup_trace:
+            startup_trace.write(args.startup_trace, {"assets": asset_cache.stats(), "fonts": font_registry.stats()})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+from typing import Dict, Iterable, Sequence
+
+# Summaries of timing samples, for everything that reports how long things take: the profiler overlay, the benchmarks,
+# the load test and the input and sound latency trackers. Nothing here needs pygame.
+
+
+def percentile(ordered: Sequence[float], p: float) -> float:
+    # Nearest rank percentile of samples that are already sorted, p going from 0 to 100
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def latency_stats(samples: Iterable[float]) -> Dict[str, float]:
+    # Mean, 95th percentile and worst of a set of latencies, nothing when there are none yet
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    return {
+        "mean": sum(ordered) / len(ordered),
+        "p95": percentile(ordered, 95),
+        "max": ordered[-1]
+    }
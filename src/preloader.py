@@ -0,0 +1,168 @@
+import os
+import threading
+from itertools import count
+from pathlib import Path
+from queue import Empty, PriorityQueue, Queue
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from pygame import image, Rect, Surface
+from pygame.mixer import Sound
+
+from assets import asset_cache
+from consts import *
+
+# Loads assets on a pool of worker threads ahead of the screens that need them. Workers only read and decode files,
+# the display dependent convert() happens on the main thread in process(), so finished surfaces end up in asset_cache
+# exactly as if a sprite had loaded them itself.
+#
+# The queue is ordered by priority, lowest first. Whenever the game moves to another screen, the screens closest to it
+# get bumped to the front. A sprite that needs an asset before its turn comes up gets it through asset_cache's
+# decoder hook: if a worker already has it, the main thread waits for that worker, otherwise it decodes it itself.
+
+QUEUED = 0
+LOADING = 1
+DONE = 2
+
+
+class PreloadJob:
+    __slots__ = ("path", "modes", "state", "result", "error", "finished")
+
+    def __init__(self, path: Path, modes: Set[Optional[str]]):
+        self.path = path
+        self.modes = modes  # Conversion modes wanted for images, None for sounds
+        self.state = QUEUED
+        self.result: Optional[Union[Surface, Sound]] = None
+        self.error: Optional[Exception] = None
+        self.finished = threading.Event()
+
+    def run(self):
+        try:
+            self.result = Sound(self.path) if None in self.modes else image.load(self.path)
+        except Exception as e:  # Handed to whoever needs the asset, same as if they had loaded it themselves
+            self.error = e
+        self.state = DONE
+        self.finished.set()
+
+
+class AssetPreloader:
+    def __init__(self, workers: int = min(4, os.cpu_count() or 1)):
+        self.queue: "PriorityQueue[Tuple[int, int, Path]]" = PriorityQueue()
+        self.decoded: "Queue[PreloadJob]" = Queue()  # Finished jobs, waiting for the main thread
+        self.jobs: Dict[Path, PreloadJob] = {}
+        self.lock = threading.Lock()
+        self.order = count()  # Ties keep the order assets were requested in
+        self.total = 0
+        self.completed = 0
+
+        self.threads = [threading.Thread(target=self.work, name=f"preloader-{i}", daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def request(self, path: Path, mode: Optional[str], priority: int):
+        # mode is the conversion mode for images, None for sounds
+        # Already there, or in a texture atlas: nothing to decode either way
+        if mode is None:
+            cached = path in asset_cache.sounds
+        else:
+            cached = (path, mode) in asset_cache.surfaces or path in asset_cache.atlas_regions
+        if cached:
+            return
+        with self.lock:
+            job = self.jobs.get(path)
+            if job is None:
+                job = self.jobs[path] = PreloadJob(path, {mode})
+                self.total += 1
+            else:
+                job.modes.add(mode)
+            if job.state == QUEUED:
+                # Stale entries with a worse priority stay in the queue and get skipped once the job is done
+                self.queue.put((priority, next(self.order), path))
+
+    def request_all(self, assets: Iterable[Tuple[Path, Optional[str]]], priority: int):
+        for path, mode in assets:
+            self.request(path, mode, priority)
+
+    def work(self):
+        while True:
+            _, _, path = self.queue.get()
+            if path is None:
+                return
+            with self.lock:
+                job = self.jobs.get(path)
+                if job is None or job.state != QUEUED:  # Done and handed over already
+                    continue
+                job.state = LOADING
+            job.run()
+            self.decoded.put(job)
+
+    def take(self, path: Path) -> Optional[Union[Surface, Sound]]:
+        # asset_cache's decoder hook, on the main thread. None for anything that was never requested.
+        job = self.jobs.get(path)
+        if job is None:
+            return None
+        with self.lock:
+            run_here = job.state == QUEUED
+            if run_here:
+                job.state = LOADING
+        if run_here:
+            job.run()
+            self.decoded.put(job)
+        else:
+            job.finished.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def process(self):
+        # Main thread: convert whatever the workers finished and hand it to the asset cache
+        while True:
+            try:
+                job = self.decoded.get_nowait()
+            except Empty:
+                return
+            if job.error is None:
+                for mode in job.modes:
+                    if mode is None:
+                        asset_cache.sounds.setdefault(job.path, job.result)
+                    else:
+                        asset_cache.add(job.path, mode, job.result)
+            # The asset cache has it now, the job doesn't need to hold on to it. Requesting the same path again in a
+            # mode the cache doesn't have yet makes a new job.
+            job.result = None
+            with self.lock:
+                if self.jobs.get(job.path) is job:
+                    del self.jobs[job.path]
+            self.completed += 1
+
+    def progress(self) -> float:
+        return self.completed / self.total if self.total else 1.0
+
+    def done(self) -> bool:
+        return self.completed == self.total
+
+    def close(self):
+        for _ in self.threads:
+            self.queue.put((-1, next(self.order), None))
+
+
+class LoadingIndicator:
+    # Thin progress bar along the bottom of the screen while the preloader is busy. Drawn as a renderer overlay.
+    def __init__(self, preloader: AssetPreloader):
+        self.preloader = preloader
+        self.rect = Rect(0, SCREEN_HEIGHT - 4, SCREEN_WIDTH, 4)
+
+    @property
+    def visible(self) -> bool:
+        return not self.preloader.done()
+
+    def draw(self, screen):
+        done = self.rect.copy()
+        done.width = int(self.rect.width * self.preloader.progress())
+        screen.fill(DARKER_FONT_COLOR, self.rect)
+        screen.fill(FONT_COLOR, done)
+
+
+def screen_priorities(screens: List[str], current: str) -> Dict[str, int]:
+    # Screens in the order the game goes through them, starting from the current one
+    start = screens.index(current)
+    return {screen: (i - start) % len(screens) for i, screen in enumerate(screens)}
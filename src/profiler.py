@@ -0,0 +1,150 @@
+import json
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Union
+
+from pygame import Rect, Surface
+from pygame.locals import SRCALPHA
+
+from consts import *
+from fonts import get_font
+from metrics import percentile
+from scaling import invalidate
+
+# Frame profiler behind the --profile flag. Sections of the main loop get timed with
+#     with frame_profiler.section("name"):
+# and feed the on-screen overlay. With a trace path set, every section is also streamed to a file: .json files use
+# the Chrome trace event format (chrome://tracing, Perfetto, speedscope), anything else gets CSV. While profiling is
+# off, section() hands back a shared do-nothing context manager.
+
+NO_SECTION = nullcontext()
+FRAME_HISTORY = 600  # Frames kept for percentiles, 10 seconds at 60 FPS
+
+
+class FrameProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.origin = perf_counter()
+        self.frame_start: Optional[float] = None
+        self.frame_times = deque(maxlen=FRAME_HISTORY)
+        self.totals: Dict[str, float] = {}  # Time per section over the current frame
+        self.averages: Dict[str, float] = {}  # Per frame section times, smoothed over recent frames
+        self.trace = None
+        self.trace_is_json = False
+
+    def enable(self, trace_path: Optional[Path] = None):
+        self.enabled = True
+        if trace_path is not None:
+            self.trace = trace_path.open("w", encoding="utf-8")
+            self.trace_is_json = trace_path.suffix.lower() == ".json"
+            # JSON array format, which allows leaving off the closing bracket if the game dies before close()
+            self.trace.write("[\n" if self.trace_is_json else "name,start_us,duration_us\n")
+
+    def close(self):
+        if self.trace is not None:
+            if self.trace_is_json:
+                self.trace.write("{}]\n")  # The closing bracket needs something after the last comma
+            self.trace.close()
+            self.trace = None
+
+    def section(self, name: str):
+        if not self.enabled:
+            return NO_SECTION
+        return self.timed_section(name)
+
+    @contextmanager
+    def timed_section(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, perf_counter() - start)
+
+    def record(self, name: str, start: float, duration: float):
+        self.totals[name] = self.totals.get(name, 0) + duration
+        if self.trace is not None:
+            start_us = (start - self.origin) * 1e6
+            if self.trace_is_json:
+                event = {"name": name, "ph": "X", "ts": round(start_us, 1), "dur": round(duration * 1e6, 1),
+                         "pid": 0, "tid": 0}
+                self.trace.write(json.dumps(event) + ",\n")
+            else:
+                self.trace.write(f"{name},{start_us:.1f},{duration * 1e6:.1f}\n")
+
+    def begin_frame(self):
+        if self.enabled:
+            self.frame_start = perf_counter()
+            self.totals = {}
+
+    def end_frame(self):
+        if self.enabled and self.frame_start is not None:
+            duration = perf_counter() - self.frame_start
+            self.frame_times.append(duration)
+            self.record("frame", self.frame_start, duration)
+            for name in self.averages.keys() | self.totals.keys():
+                self.averages[name] = self.averages.get(name, 0) * 0.95 + self.totals.get(name, 0) * 0.05
+            self.frame_start = None
+
+    def percentiles(self, *ps: float) -> List[float]:
+        if not self.frame_times:
+            return [0.0] * len(ps)
+        ordered = sorted(self.frame_times)
+        return [percentile(ordered, p) for p in ps]
+
+
+# Does nothing until main() enables it for --profile
+frame_profiler = FrameProfiler()
+
+
+def timed(name: Union[str, Callable]):
+    # Decorator timing a method as a section. name can be a function of the instance, to tell calls apart.
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not frame_profiler.enabled:
+                return func(self, *args, **kwargs)
+            with frame_profiler.timed_section(name(self) if callable(name) else name):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ProfilerOverlay:
+    # Frame time percentiles and the slowest sections, drawn over the top right corner of the screen
+    def __init__(self, profiler: FrameProfiler, lines=12, extra: Optional[Callable[[], List[str]]] = None):
+        self.profiler = profiler
+        self.extra = extra  # More lines to show under the frame times, measurements from elsewhere in the game
+        self.visible = True
+        self.font = get_font(VERDANA, 16)
+        self.line_height = self.font.get_linesize()
+        self.lines = lines
+        self.rect = Rect(SCREEN_WIDTH - 330, 0, 330, self.line_height * lines + 10)
+        self.surf = Surface(self.rect.size, SRCALPHA)
+        self.last_update = 0.0
+
+    def toggle(self):
+        self.visible = not self.visible
+
+    def draw(self, screen):
+        # Text only gets re-rendered a few times per second, so the overlay barely shows up in its own numbers
+        now = perf_counter()
+        if now - self.last_update > 0.25:
+            self.last_update = now
+            self.render()
+        screen.blit(self.surf, self.rect)
+
+    def render(self):
+        p50, p95, p99 = (t * 1000 for t in self.profiler.percentiles(50, 95, 99))
+        text = [f"frame ms  p50 {p50:.2f}  p95 {p95:.2f}  p99 {p99:.2f}"]
+        if self.extra is not None:
+            text += self.extra()
+        slowest = sorted(((t, name) for name, t in self.profiler.averages.items() if name != "frame"), reverse=True)
+        text += [f"{name}: {t * 1000:.3f} ms" for t, name in slowest[:self.lines - len(text)]]
+
+        self.surf.fill((0, 0, 0, 170))
+        for i, line in enumerate(text):
+            self.surf.blit(self.font.render(line, True, WHITE), (8, 5 + i * self.line_height))
+        invalidate(self.surf)  # Scaled again the next time it's drawn
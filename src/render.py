@@ -0,0 +1,105 @@
+from typing import Any, Dict, List
+
+import pygame
+from pygame import Rect, Surface
+from pygame.sprite import Sprite
+
+from profiler import frame_profiler
+
+
+class Renderer:
+    # Draws the game to the display. In dirty-rect mode only sprites whose render state changed since the last frame
+    # get redrawn, and only their rects are sent to the display. Everything else (background, titles, prompt text)
+    # stays composited on the screen surface from the previous frames.
+    #
+    # Sprites that can change between screen rebuilds expose render_state(gamestate), returning a hashable value that
+    # captures everything their draw() depends on. Sprites without it are treated as static.
+    #
+    # Overlays (like the profiler's) sit on top of everything and get redrawn every frame while visible. They need a
+    # fixed rect, a visible flag and draw(screen).
+    #
+    # screen can also be a scaling.ScaledScreen, everything still happens in logical coordinates until the dirty rects
+    # go to the display.
+    def __init__(self, screen: Surface, dirty_rects=True):
+        self.screen = screen
+        self.to_display = getattr(screen, "to_physical", None)
+        self.dirty_rects = dirty_rects
+        self.overlays = []
+
+        # What the screen currently shows
+        self.game = None
+        self.screen_version = -1
+        self.states: Dict[Sprite, Any] = {}
+        self.overlays_shown = []
+
+    def render(self, game, background: Surface) -> bool:
+        # Returns whether anything got drawn
+        if not self.dirty_rects:
+            self.draw_full(game, background)
+            self.draw_overlays()
+            with frame_profiler.section("display_flip"):
+                pygame.display.flip()
+            return True
+        elif game is not self.game or game.screen_version != self.screen_version:
+            # New game or rebuilt screen, nothing on the display can be reused
+            self.draw_full(game, background)
+            self.game = game
+            self.screen_version = game.screen_version
+            self.states = {sprite: get_render_state(sprite, game) for sprite in game.all_sprites}
+            self.draw_overlays()
+            with frame_profiler.section("display_flip"):
+                pygame.display.flip()
+            return True
+        else:
+            dirty = self.find_dirty(game)
+            # Overlays change every frame, and one that just got hidden has to be drawn over
+            dirty += [overlay.rect for overlay in self.overlays_shown]
+            dirty += [overlay.rect for overlay in self.overlays if overlay.visible]
+            if dirty:
+                self.redraw(game, background, dirty)
+                self.draw_overlays()
+                if self.to_display is not None:
+                    dirty = [self.to_display(rect) for rect in dirty]
+                with frame_profiler.section("display_update"):
+                    pygame.display.update(dirty)
+                return True
+            return False
+
+    def draw_full(self, game, background: Surface):
+        with frame_profiler.section("background"):
+            self.screen.blit(background, background.get_rect())
+        with frame_profiler.section("draw"):
+            game.draw(self.screen)
+
+    def draw_overlays(self):
+        self.overlays_shown = [overlay for overlay in self.overlays if overlay.visible]
+        for overlay in self.overlays_shown:
+            overlay.draw(self.screen)
+
+    def find_dirty(self, game) -> List[Rect]:
+        dirty = []
+        for sprite in game.all_sprites:
+            state = get_render_state(sprite, game)
+            if state != self.states.get(sprite):
+                self.states[sprite] = state
+                dirty.append(sprite.rect)
+        return dirty
+
+    def redraw(self, game, background: Surface, dirty: List[Rect]):
+        for rect in dirty:
+            # Restore the background under the rect, then redraw everything overlapping it, clipped to the rect
+            self.screen.set_clip(rect)
+            with frame_profiler.section("background"):
+                self.screen.blit(background, rect, rect)
+            with frame_profiler.section("draw"):
+                for sprite in game.all_sprites:
+                    if sprite.rect.colliderect(rect):
+                        with frame_profiler.section(type(sprite).__name__):
+                            sprite.draw(self.screen, game)
+        self.screen.set_clip(None)
+
+
+def get_render_state(sprite: Sprite, gamestate) -> Any:
+    if hasattr(sprite, "render_state"):
+        return sprite.render_state(gamestate)
+    return None
@@ -0,0 +1,162 @@
+import argparse
+import json
+import random
+import struct
+import sys
+from pathlib import Path
+from time import perf_counter
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from consts import *
+from engine import GameEngine, load_scenarios, Scenario
+from selection import make_selector, SELECTOR_NAMES
+
+# Session recordings. The game's RNG gets seeded with a known seed, and every input that matters to the rules is
+# logged, so a session plays out exactly the same way again from just the log, without any of pygame.
+#
+# Layout, all little-endian:
+#   header  magic, version, seed, how scenarios got drawn (position in selection.SELECTOR_NAMES)
+#   events  one byte each:
+#           0-7  a choice picked, prompt * 2 + choice (0 for the left button, 1 for the right one)
+#           8-11 a prompt cleared (a click between its two buttons), 8 + prompt
+#           12   next quarter
+#           13   mute toggled
+#           14   new game
+
+MAGIC = b"ATBREC\0\0"
+VERSION = 2
+HEADER = struct.Struct("<8sHQB")
+V1_HEADER = struct.Struct("<8sHQ")  # Version 1 had no selector, every game in it drew at random
+CLEAR_CHOICE = 8
+NEXT_QUARTER = 12
+TOGGLE_MUTE = 13
+NEW_GAME = 14
+
+Outcome = Dict[str, Union[int, bool, Dict[str, int]]]
+
+
+def choice_event(prompt: int, choice: Optional[int]) -> int:
+    return CLEAR_CHOICE + prompt if choice is None else prompt * 2 + choice
+
+
+class InputRecorder:
+    def __init__(self, path: Path, seed: int, draws: str = "random"):
+        self.seed = seed
+        self.fp: BinaryIO = path.open("wb")
+        self.fp.write(HEADER.pack(MAGIC, VERSION, seed, SELECTOR_NAMES.index(draws)))
+
+    def record(self, event: int):
+        self.fp.write(bytes((event,)))
+        if event in (NEXT_QUARTER, NEW_GAME):  # On every transition, so a crash loses at most the quarter in progress
+            self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
+
+def read_recording(data: bytes) -> Tuple[int, str, bytes]:
+    # Seed, selector name and events of a recording
+    if len(data) < V1_HEADER.size:
+        raise ValueError("Too short to be a recording")
+    magic, version, seed = V1_HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a recording")
+    if version == 1:
+        return seed, "random", data[V1_HEADER.size:]
+    if version != VERSION:
+        raise ValueError(f"Recording version {version} is not supported, expected {VERSION}")
+    if len(data) < HEADER.size:
+        raise ValueError("Too short to be a recording")
+    selector = HEADER.unpack_from(data)[3]
+    if selector >= len(SELECTOR_NAMES):
+        raise ValueError(f"Unknown selector {selector}")
+    return seed, SELECTOR_NAMES[selector], data[HEADER.size:]
+
+
+def replay(data: bytes, scenarios: Sequence[Scenario]) -> List[Outcome]:
+    # Plays a recording out on the bare rules, as fast as they go. Returns how each game in it ended, the last one
+    # possibly still running when the recording stopped.
+    seed, draws, events = read_recording(data)
+    rng = random.Random(seed)  # The game seeds the random module itself, which is a Random like this one
+
+    outcomes = []
+    game = GameEngine(scenarios, rng, make_selector(draws, len(scenarios)))
+    game.draw_scenarios()
+    for event in events:
+        if event < NEXT_QUARTER and not game.current_indices:
+            raise ValueError("Recording picks a choice when there are no scenarios on screen")
+        if event < CLEAR_CHOICE:
+            game.choose(event // 2, event % 2)
+        elif event < NEXT_QUARTER:
+            game.choose(event - CLEAR_CHOICE, None)
+        elif event == NEXT_QUARTER:
+            if not game.ready_for_next_round():
+                raise ValueError("Recording moves on to the next quarter before every prompt has a choice")
+            game.end_quarter()
+            if not game.fired:
+                game.draw_scenarios()
+        elif event == NEW_GAME:
+            outcomes.append(outcome(game))
+            game = GameEngine(scenarios, rng, make_selector(draws, len(scenarios)))
+            game.draw_scenarios()
+        elif event != TOGGLE_MUTE:  # Muting doesn't change anything about the rules
+            raise ValueError(f"Unknown event {event}")
+    outcomes.append(outcome(game))
+    return outcomes
+
+
+def outcome(game: GameEngine) -> Outcome:
+    return {
+        "year": game.year,
+        "quarter": game.quarter,
+        "fired": game.fired,
+        "meters": dict(zip(METERS, game.meters))
+    }
+
+
+def recordings(paths: List[Path]) -> Iterator[Path]:
+    # Files given directly, plus every recording in the directories given
+    for path in paths:
+        if path.is_dir():
+            yield from sorted(path.rglob("*.atbrec"))
+        else:
+            yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded sessions on the game's rules, headless")
+    parser.add_argument("recordings", type=Path, nargs="+", help="recordings, or directories to search for them")
+    parser.add_argument("--scenarios", type=Path, default=ASSETS_DIR / "scenarios.json", help="scenarios JSON or pack")
+    parser.add_argument("--out", type=Path, help="write every session's outcomes here as JSON lines")
+    parser.add_argument("--compare", type=Path, metavar="OUTCOMES",
+                        help="report sessions that end differently than in outcomes saved with --out")
+    args = parser.parse_args()
+
+    scenarios = load_scenarios(args.scenarios)
+    results: Dict[str, List[Outcome]] = {}
+    start = perf_counter()
+    for path in recordings(args.recordings):
+        try:
+            results[str(path)] = replay(path.read_bytes(), scenarios)
+        except (OSError, ValueError) as e:  # Unreadable or not a valid recording, the rest can still be replayed
+            print(f"{path}: {e}", file=sys.stderr)
+    elapsed = perf_counter() - start
+    print(f"Replayed {len(results)} session(s) in {elapsed:.3f}s ({len(results) / max(elapsed, 1e-9):.0f}/s)")
+
+    if args.out:
+        with args.out.open("w") as fp:
+            for path, outcomes in results.items():
+                fp.write(json.dumps({"recording": path, "outcomes": outcomes}) + "\n")
+
+    if args.compare:
+        with args.compare.open() as fp:
+            expected = {entry["recording"]: entry["outcomes"] for entry in map(json.loads, fp)}
+        changed = [path for path, outcomes in results.items() if path in expected and expected[path] != outcomes]
+        for path in changed:
+            print(f"{path}: expected {expected[path]}, got {results[path]}")
+        if changed:
+            sys.exit(f"{len(changed)} session(s) ended differently")
+
+
+if __name__ == "__main__":
+    main()
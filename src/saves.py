@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Optional, Sequence
+
+from engine import GameEngine, Scenario, Snapshot
+
+# Saved games. The game autosaves at the start of every quarter, so it can be picked up there again next time. Saves
+# are GameEngine.serialize()'s few dozen bytes, written out on a thread of their own so a slow disk never holds up a
+# frame.
+
+
+class Autosaver:
+    def __init__(self, path: Path):
+        self.path = path
+        self.pending: Optional[bytes] = None  # Only the latest save matters, older ones still waiting get dropped
+        self.closed = False
+        self.wake = threading.Condition()
+        self.thread = threading.Thread(target=self.work, name="autosave", daemon=True)
+        self.thread.start()
+
+    def save(self, data: bytes):
+        with self.wake:
+            self.pending = data
+            self.wake.notify()
+
+    def work(self):
+        while True:
+            with self.wake:
+                while self.pending is None and not self.closed:
+                    self.wake.wait()
+                data, self.pending = self.pending, None
+            if data is None:
+                return
+            # Write next to it and swap it in, so quitting halfway through a write never leaves a broken save
+            temp = self.path.with_name(self.path.name + ".tmp")
+            try:
+                temp.write_bytes(data)
+                os.replace(temp, self.path)
+            except OSError as e:  # Not worth stopping the game over
+                print(f"Could not save the game to {self.path}: {e}", file=sys.stderr)
+
+    def close(self):
+        # Finishes writing whatever is still pending
+        with self.wake:
+            self.closed = True
+            self.wake.notify()
+        self.thread.join()
+
+
+def load_save(path: Path, scenarios: Sequence[Scenario]) -> Optional[Snapshot]:
+    # The saved game at path, or None if there isn't one to carry on with
+    if not path.exists():
+        return None
+    saved = GameEngine(scenarios)
+    try:
+        saved.restore_serialized(path.read_bytes())
+    except (OSError, ValueError) as e:
+        print(f"Could not load the saved game from {path}: {e}", file=sys.stderr)
+        return None
+    return None if saved.fired else saved.snapshot()
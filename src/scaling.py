@@ -0,0 +1,132 @@
+from math import floor
+from typing import Optional, Sequence, Tuple, Union
+from weakref import WeakKeyDictionary
+
+from pygame import mouse, Rect, Surface, transform
+from pygame.font import Font
+from pygame.locals import SRCALPHA
+
+from consts import *
+from fonts import font_registry
+
+# Output at other resolutions than the 1280x720 everything is laid out in. The game keeps drawing in those logical
+# coordinates, onto a ScaledScreen that puts each surface on the display at the scale it fits the display with, centered
+# with black bars where the aspect ratios differ. Mouse positions get mapped back the other way.
+#
+# Nothing gets scaled per frame. Every surface drawn is swapped for a copy scaled once per output resolution: images get
+# smoothscaled the first time they're needed, and text gets rendered a second time with its font at the output size,
+# so it stays sharp. At 1:1 none of this is in the way, the display surface gets drawn on directly.
+
+Point = Tuple[int, int]
+RectLike = Union[Rect, Sequence[int]]
+
+
+class Scaler:
+    def __init__(self, output_size: Point):
+        self.output_size = output_size
+        self.scale = min(output_size[0] / SCREEN_WIDTH, output_size[1] / SCREEN_HEIGHT)
+        self.offset = ((output_size[0] - floor(SCREEN_WIDTH * self.scale)) // 2,
+                       (output_size[1] - floor(SCREEN_HEIGHT * self.scale)) // 2)
+
+        # Scaled copy of every surface drawn so far, dropped along with the surface
+        self.surfaces: "WeakKeyDictionary[Surface, Surface]" = WeakKeyDictionary()
+
+    def rect(self, rect: RectLike) -> Rect:
+        # Edges map independently, so rects that touch in logical coordinates still touch once scaled
+        rect = Rect(rect)
+        left, top = floor(rect.left * self.scale), floor(rect.top * self.scale)
+        return Rect(left, top, floor(rect.right * self.scale) - left, floor(rect.bottom * self.scale) - top)
+
+    def size(self, size: Point) -> Point:
+        return max(1, round(size[0] * self.scale)), max(1, round(size[1] * self.scale))
+
+    def to_logical(self, pos: Point) -> Point:
+        # Rounds down, so positions in the bars left of and above the game land outside it too, not on its edge
+        return floor((pos[0] - self.offset[0]) / self.scale), floor((pos[1] - self.offset[1]) / self.scale)
+
+    def font(self, font: Font) -> Font:
+        return font_registry.scaled(font, self.scale)
+
+    def scaled(self, surf: Surface) -> Surface:
+        scaled = self.surfaces.get(surf)
+        if scaled is None:
+            if surf.get_bitsize() >= 24:
+                scaled = transform.smoothscale(surf, self.size(surf.get_size()))
+            else:
+                scaled = transform.scale(surf, self.size(surf.get_size()))
+            scaled = scaled.convert_alpha() if surf.get_flags() & SRCALPHA else scaled.convert()
+            if surf.get_colorkey() is not None:
+                scaled.set_colorkey(surf.get_colorkey())
+            if surf.get_alpha() is not None and not surf.get_flags() & SRCALPHA:
+                scaled.set_alpha(surf.get_alpha())
+            self.surfaces[surf] = scaled
+        return scaled
+
+    def register(self, surf: Surface, scaled: Surface):
+        # Use scaled in place of surf, for surfaces that can be made better at the output size than by scaling
+        self.surfaces[surf] = scaled
+
+
+class ScaledScreen:
+    # Stands in for a surface everything gets drawn onto in logical coordinates, with just the Surface methods the
+    # renderer, sprites and overlays use
+    def __init__(self, target: Surface, scaler: Scaler, offset: Point = (0, 0)):
+        self.target = target
+        self.scaler = scaler
+        self.offset = offset
+
+    def to_physical(self, rect: RectLike) -> Rect:
+        return self.scaler.rect(rect).move(self.offset)
+
+    def blit(self, source: Surface, dest: Union[Point, RectLike], area: Optional[RectLike] = None) -> Rect:
+        x, y = self.to_physical((dest[0], dest[1], 0, 0)).topleft
+        return self.target.blit(self.scaler.scaled(source), (x, y), self.scaler.rect(area) if area else None)
+
+    def fill(self, color, rect: Optional[RectLike] = None) -> Rect:
+        return self.target.fill(color, self.to_physical(self.get_rect() if rect is None else rect))
+
+    def set_clip(self, rect: Optional[RectLike]):
+        self.target.set_clip(None if rect is None else self.to_physical(rect))
+
+    def get_size(self) -> Point:
+        return SCREEN_WIDTH, SCREEN_HEIGHT
+
+    def get_rect(self) -> Rect:
+        return Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+
+
+# The scaler for the display, None when the display is the logical size
+scaler: Optional[Scaler] = None
+
+
+def scale_display(display: Surface) -> Union[Surface, ScaledScreen]:
+    # What to draw the game on for this display
+    global scaler
+    if display.get_size() == (SCREEN_WIDTH, SCREEN_HEIGHT):
+        scaler = None
+        return display
+    scaler = Scaler(display.get_size())
+    display.fill(BLACK)  # The bars never get drawn over
+    return ScaledScreen(display, scaler, scaler.offset)
+
+
+def to_logical(pos: Point) -> Point:
+    return scaler.to_logical(pos) if scaler is not None else pos
+
+
+def mouse_pos() -> Point:
+    return to_logical(mouse.get_pos())
+
+
+def render_text(font: Font, text: str, color) -> Surface:
+    # font.render, plus a sharp copy at the output size when there's scaling
+    surf = font.render(text, True, color)
+    if scaler is not None:
+        scaler.register(surf, scaler.font(font).render(text, True, color))
+    return surf
+
+
+def invalidate(surf: Surface):
+    # For surfaces that got drawn on after they were drawn to the screen, their scaled copy is out of date
+    if scaler is not None:
+        scaler.surfaces.pop(surf, None)
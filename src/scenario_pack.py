@@ -0,0 +1,206 @@
+import argparse
+import json
+import mmap
+import struct
+import sys
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from consts import *
+
+# Compiled scenario packs. At build time the scenarios JSON is validated against scenarios.schema.json and written out
+# as one binary file. At runtime that file is memory-mapped and scenarios are read out of it lazily, one at a time,
+# straight from the mapping.
+#
+# Layout, all little-endian:
+#   header       magic, version, meter count, scenario count, string count and the offsets of the sections below
+#   effects      int8[scenarios][2 choices][meters], meters ordered like consts.METERS
+#   records      uint32[scenarios][3], string ids of the scenario text and the two choices
+#   string index uint32[strings + 1], offset of each string into the string data, plus the end of the last one
+#   string data  UTF-8 text of every distinct string, each stored once
+
+MAGIC = b"ATBPACK\0"
+VERSION = 1
+HEADER = struct.Struct("<8sHHIIIIII")
+RECORD_FIELDS = (SCENARIO_TEXT, CHOICE_ONE, CHOICE_TWO)
+RESULT_FIELDS = (CHOICE_ONE_RESULTS, CHOICE_TWO_RESULTS)
+SCHEMA_PATH = ASSETS_DIR.parent / "scenarios.schema.json"  # Next to the assets, in the checkout the build runs from
+
+
+# Just enough JSON Schema to check scenarios.schema.json, so building a pack needs nothing outside the stdlib
+def validate(instance: Any, schema: Dict[str, Any], path: str = "$"):
+    types = {
+        "object": dict,
+        "array": list,
+        "string": str,
+        "integer": int,
+        "boolean": bool
+    }
+    expected = schema.get("type")
+    if expected is not None:
+        # bool is a subclass of int, but true is not an integer as far as JSON is concerned
+        if not isinstance(instance, types[expected]) or (expected == "integer" and isinstance(instance, bool)):
+            raise ValueError(f"{path}: expected {expected}, got {type(instance).__name__}")
+
+    if isinstance(instance, dict):
+        for key in schema.get("required", ()):
+            if key not in instance:
+                raise ValueError(f"{path}: missing required property {key!r}")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in instance:
+                validate(instance[key], subschema, f"{path}.{key}")
+    elif isinstance(instance, list):
+        if len(instance) < schema.get("minItems", 0):
+            raise ValueError(f"{path}: needs at least {schema['minItems']} item(s)")
+        if schema.get("uniqueItems"):
+            seen = set()
+            for i, item in enumerate(instance):
+                key = json.dumps(item, sort_keys=True)
+                if key in seen:
+                    raise ValueError(f"{path}[{i}]: duplicate item")
+                seen.add(key)
+        if "items" in schema:
+            for i, item in enumerate(instance):
+                validate(item, schema["items"], f"{path}[{i}]")
+    elif isinstance(instance, int):
+        if "minimum" in schema and instance < schema["minimum"]:
+            raise ValueError(f"{path}: {instance} is below the minimum of {schema['minimum']}")
+        if "maximum" in schema and instance > schema["maximum"]:
+            raise ValueError(f"{path}: {instance} is above the maximum of {schema['maximum']}")
+
+
+def compile_pack(scenarios: List[Dict[str, Any]], schema: Dict[str, Any]) -> bytes:
+    validate(scenarios, schema)
+
+    strings: List[str] = []
+    string_ids: Dict[str, int] = {}
+    effects = bytearray()
+    records = bytearray()
+    for i, scenario in enumerate(scenarios):
+        for field in RESULT_FIELDS:
+            for meter in METERS:
+                # The game reads all four meters for every choice, the schema just does not insist on them
+                if meter not in scenario[field]:
+                    raise ValueError(f"$[{i}].{field}: missing meter {meter!r}")
+                effects += struct.pack("<b", scenario[field][meter])
+        for field in RECORD_FIELDS:
+            text = scenario[field]
+            if text not in string_ids:
+                string_ids[text] = len(strings)
+                strings.append(text)
+            records += struct.pack("<I", string_ids[text])
+
+    string_data = bytearray()
+    string_index = bytearray()
+    for text in strings:
+        string_index += struct.pack("<I", len(string_data))
+        string_data += text.encode("utf-8")
+    string_index += struct.pack("<I", len(string_data))
+
+    # Keep the uint32 sections aligned
+    effects += bytes(-len(effects) % 4)
+    effects_offset = HEADER.size
+    records_offset = effects_offset + len(effects)
+    index_offset = records_offset + len(records)
+    data_offset = index_offset + len(string_index)
+
+    header = HEADER.pack(MAGIC, VERSION, len(METERS), len(scenarios), len(strings),
+                         effects_offset, records_offset, index_offset, data_offset)
+    return header + effects + records + string_index + string_data
+
+
+class PackedScenario(Mapping):
+    # Read-only view of one scenario in a pack, usable anywhere the JSON scenario dicts are
+    def __init__(self, pack: "ScenarioPack", index: int):
+        self.pack = pack
+        self.index = index
+
+    def __getitem__(self, key: str):
+        if key in RECORD_FIELDS:
+            return self.pack.string(self.pack.record(self.index, RECORD_FIELDS.index(key)))
+        if key in RESULT_FIELDS:
+            return self.pack.results(self.index, RESULT_FIELDS.index(key))
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(RECORD_FIELDS + RESULT_FIELDS)
+
+    def __len__(self) -> int:
+        return len(RECORD_FIELDS) + len(RESULT_FIELDS)
+
+
+class ScenarioPack(Sequence):
+    def __init__(self, path: Path):
+        with path.open("rb") as fp:
+            self.buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, meters, self.count, self.string_count, self.effects_offset, self.records_offset, \
+            self.index_offset, self.data_offset = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION or meters != len(METERS):
+            raise ValueError(f"{path} is not a compatible scenario pack")
+
+        # Zero-copy view of the (scenarios, 2, meters) int8 effect matrix
+        effects_end = self.effects_offset + self.count * 2 * meters
+        self.effects = memoryview(self.buffer)[self.effects_offset:effects_end].cast("b")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> PackedScenario:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("scenario index out of range")
+        return PackedScenario(self, index)
+
+    def record(self, index: int, field: int) -> int:
+        return struct.unpack_from("<I", self.buffer, self.records_offset + (index * 3 + field) * 4)[0]
+
+    def string(self, string_id: int) -> str:
+        start, end = struct.unpack_from("<II", self.buffer, self.index_offset + string_id * 4)
+        return str(self.buffer[self.data_offset + start:self.data_offset + end], "utf-8")
+
+    def results(self, index: int, choice: int) -> Dict[str, int]:
+        start = (index * 2 + choice) * len(METERS)
+        return dict(zip(METERS, self.effects[start:start + len(METERS)]))
+
+
+class PackEffects(Sequence):
+    # Every choice's meter changes as a tuple in METERS order, at scenario * 2 + choice, read out of the pack one at a
+    # time as they're asked for. Same layout as engine.effect_table() builds for JSON scenarios.
+    def __init__(self, pack: ScenarioPack):
+        self.effects = pack.effects
+
+    def __len__(self) -> int:
+        return len(self.effects) // len(METERS)
+
+    def __getitem__(self, index: int) -> Tuple[int, ...]:
+        start = index * len(METERS)
+        return tuple(self.effects[start:start + len(METERS)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate a scenarios JSON file and compile it into a scenario pack")
+    parser.add_argument("scenarios", type=Path, help="scenarios JSON file")
+    parser.add_argument("output", type=Path, help="where to write the pack")
+    parser.add_argument("--schema", type=Path, default=SCHEMA_PATH, help="JSON schema to validate against")
+    args = parser.parse_args()
+
+    with args.scenarios.open(encoding="utf-8") as fp:
+        scenarios = json.load(fp)
+    with args.schema.open(encoding="utf-8") as fp:
+        schema = json.load(fp)
+
+    try:
+        pack = compile_pack(scenarios, schema)
+    except ValueError as e:
+        sys.exit(f"{args.scenarios}: {e}")
+    args.output.write_bytes(pack)
+    print(f"Wrote {len(scenarios)} scenarios to {args.output} ({len(pack)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+from time import perf_counter
+from typing import Dict, List
+
+import pygame
+from pygame.event import Event
+
+from consts import *
+
+# Decides how the main loop waits between frames. While something is changing on screen or work is in progress, frames
+# come at FRAME_RATE like always. Once everything has settled for ACTIVE_LINGER seconds, the loop sleeps until an
+# event shows up instead, so a game left on a screen the player is reading costs next to no CPU. The first event after
+# that brings back the full frame rate.
+#
+# pygame.event.wait() would be the obvious way to sleep, but pygame implements its timeout by checking the queue every
+# millisecond, which wakes the process up more often than just running at 60 FPS. So the queue gets checked every
+# IDLE_POLL_MS instead, sleeping in between, and whatever woke it gets handed to the next frame through events(). Every
+# IDLE_WAIT_MS there's a frame either way, as a safety net for anything that changes without an event.
+#
+# Checking goes through event.get(), not event.peek(): peek() hands back the first event itself, and reading a posted
+# event that way uses up its attributes, so the get() after it would find them missing.
+
+
+class FrameScheduler:
+    def __init__(self, frame_rate: int = FRAME_RATE, idle_poll_ms: int = IDLE_POLL_MS, idle_wait_ms: int = IDLE_WAIT_MS,
+                 linger: float = ACTIVE_LINGER):
+        self.clock = pygame.time.Clock()
+        self.frame_rate = frame_rate
+        self.idle_poll_ms = idle_poll_ms
+        self.idle_wait = idle_wait_ms / 1000
+        self.linger = linger
+        self.active_until = 0.0
+        self.woken_by: List[Event] = []
+
+        # Where the time went since the scheduler was made, in seconds
+        self.started = perf_counter()
+        self.idle_time = 0.0  # Asleep waiting for events
+        self.frames = 0
+        self.idle_frames = 0  # Frames that ended asleep
+
+    def events(self) -> List[Event]:
+        # Everything for this frame to handle, in the order it happened
+        events, self.woken_by = self.woken_by, []
+        return events + pygame.event.get()
+
+    def end_frame(self, busy: bool):
+        # busy says whether anything changed this frame or is still in progress, which keeps frames coming
+        now = perf_counter()
+        self.frames += 1
+        if busy:
+            self.active_until = now + self.linger
+        if now < self.active_until:
+            self.clock.tick(self.frame_rate)
+            return
+
+        self.idle_frames += 1
+        deadline = now + self.idle_wait
+        while perf_counter() < deadline:
+            self.woken_by = pygame.event.get()
+            if self.woken_by:
+                break
+            pygame.time.wait(self.idle_poll_ms)
+        self.idle_time += perf_counter() - now
+        self.clock.tick()  # Keeps the clock's own timing from counting the sleep as one long frame
+
+    def stats(self) -> Dict[str, float]:
+        elapsed = max(perf_counter() - self.started, 1e-9)
+        return {
+            "seconds": elapsed,
+            "idle_seconds": self.idle_time,
+            "active_seconds": elapsed - self.idle_time,
+            "idle_share": self.idle_time / elapsed,
+            "frames": self.frames,
+            "idle_frames": self.idle_frames,
+            "fps": self.frames / elapsed
+        }
+
+    def overlay_lines(self) -> List[str]:
+        stats = self.stats()
+        return [f"idle {stats['idle_share']:.0%}  effective fps {stats['fps']:.1f}"]
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (f"{stats['frames']} frames in {stats['seconds']:.1f}s ({stats['fps']:.1f} fps effective), "
+                f"{stats['active_seconds']:.1f}s active, {stats['idle_seconds']:.1f}s idle "
+                f"({stats['idle_share']:.0%})")
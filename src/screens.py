@@ -0,0 +1,50 @@
+from typing import Any, Callable, Dict, Iterable, TypeVar
+
+from pygame import Surface
+from pygame.sprite import Sprite
+
+import scaling
+
+T = TypeVar("T")
+
+
+class ScreenCache:
+    # Keeps what screens are made of between builds, so switching screens or quarters reuses it instead of building
+    # it all over again.
+    #
+    # Layers are the background with a screen's static sprites (the ones without a render_state) already drawn on it.
+    # The renderer restores dirty rects from the layer, so those sprites never need drawing again. Parts are whatever
+    # else a screen wants to keep around, like sprites that look the same every time the screen comes back.
+    def __init__(self):
+        self.layers: Dict[Any, Surface] = {}
+        self.parts: Dict[Any, Any] = {}
+
+    def layer(self, key, background: Surface, build: Callable[[], Iterable[Sprite]], gamestate) -> Surface:
+        # build makes the static sprites, it only gets called the first time
+        surf = self.layers.get(key)
+        if surf is None:
+            surf = self.layers[key] = background.copy()
+            sprites = list(build())
+            for sprite in sprites:
+                sprite.draw(surf, gamestate)
+            if scaling.scaler is not None:
+                # Drawn again at the output size, so the sprites' text stays sharp instead of getting scaled with the
+                # layer
+                scaled = scaling.scaler.scaled(background).copy()
+                scaled_screen = scaling.ScaledScreen(scaled, scaling.scaler)
+                for sprite in sprites:
+                    sprite.draw(scaled_screen, gamestate)
+                scaling.scaler.register(surf, scaled)
+        return surf
+
+    def part(self, key, build: Callable[[], T]) -> T:
+        if key not in self.parts:
+            self.parts[key] = build()
+        return self.parts[key]
+
+    def clear(self):
+        self.layers.clear()
+        self.parts.clear()
+
+
+screen_cache = ScreenCache()
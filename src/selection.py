@@ -0,0 +1,159 @@
+from array import array
+from typing import Dict, List, Sequence, Set, Tuple
+
+from caching import IdentityCache
+from consts import *
+
+# How the four scenarios of a quarter get picked. A selector draws indices into the game's scenarios, with the game's
+# RNG, and is made fresh for every game, so whatever it remembers about a run ends with the run. Selectors get told how
+# many scenarios there are up front and turn down packs too small to draw from.
+#
+# Selectors only get to look at the scenarios through the game's effect table, which packs serve straight out of their
+# mapping. Nothing here turns a scenario into a dict, so packs of any size stay lazy.
+
+DRAWS_PER_QUARTER = 4
+WEAKEST_METER_BOOST = 4.0  # How much likelier scenarios that can raise the weakest meter are than the rest
+
+
+def check_count(count: int):
+    # Same error random.sample gave the game before there were selectors
+    if count < DRAWS_PER_QUARTER:
+        raise ValueError("Sample larger than population or is negative")
+
+
+class UniformSelector:
+    # Any four scenarios, every quarter. Exactly the draws the game has always made, so seeded games and recordings
+    # come out the same.
+    predictable = True  # Draws depend on the RNG alone, so GameEngine.prefetch() can work them out ahead of time
+
+    def __init__(self, count: int):
+        check_count(count)
+
+    def draw(self, game, rng) -> List[int]:
+        return rng.sample(range(len(game.scenarios)), DRAWS_PER_QUARTER)
+
+
+class DeckSelector:
+    # Deals scenarios off a shuffled deck, so none comes up twice until the whole pack has been shown. Shuffling is
+    # once per pass through the pack, every draw after that is a pop.
+    predictable = False
+
+    def __init__(self, count: int):
+        check_count(count)
+        self.deck: List[int] = []
+
+    def draw(self, game, rng) -> List[int]:
+        if len(self.deck) >= DRAWS_PER_QUARTER:
+            return [self.deck.pop() for _ in range(DRAWS_PER_QUARTER)]
+
+        # Deal what's left, then the rest off a new deck that doesn't have those in it
+        drawn = self.deck
+        self.deck = list(range(len(game.scenarios)))
+        rng.shuffle(self.deck)
+        if drawn:
+            left = set(drawn)
+            self.deck = [index for index in self.deck if index not in left]
+        while len(drawn) < DRAWS_PER_QUARTER:
+            drawn.append(self.deck.pop())
+        return drawn
+
+
+class AliasTable:
+    # Walker's alias method: after an O(n) setup, picks index i with probability weights[i] / sum(weights) in O(1)
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        total = sum(weights)
+        scaled = [weight * n / total for weight in weights]
+        self.prob = array("d", [1.0] * n)
+        self.alias = array("I", range(n))
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large[-1]
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            if scaled[more] < 1.0:
+                small.append(large.pop())
+        # Whatever is left is 1 give or take rounding, prob already says so
+
+    def sample(self, rng) -> int:
+        i = int(rng.random() * len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+
+class ScenarioIndex:
+    # What every scenario can do to every meter, worked out once per set of scenarios. raises[m] holds the scenarios
+    # with a choice that raises meter m.
+    def __init__(self, effects: Sequence[Tuple[int, ...]]):
+        self.count = len(effects) // 2
+        self.raises = [array("I") for _ in METERS]
+        for index in range(self.count):
+            first, second = effects[index * 2], effects[index * 2 + 1]
+            for meter in range(len(METERS)):
+                if first[meter] > 0 or second[meter] > 0:
+                    self.raises[meter].append(index)
+        self.tables: Dict[Tuple[int, float], AliasTable] = {}
+
+    def weighted_toward(self, meter: int, boost: float) -> AliasTable:
+        # Scenarios that can raise meter get boost times the weight of the rest. Built the first time it's asked for.
+        table = self.tables.get((meter, boost))
+        if table is None:
+            weights = [1.0] * self.count
+            for index in self.raises[meter]:
+                weights[index] = boost
+            table = self.tables[(meter, boost)] = AliasTable(weights)
+        return table
+
+
+# Indexes get built once per set of scenarios
+scenario_indexes = IdentityCache()
+
+
+def scenario_index(game) -> ScenarioIndex:
+    return scenario_indexes.get(game.scenarios, lambda: ScenarioIndex(game.effects))
+
+
+def weakest_meter(meters: Sequence[int]) -> int:
+    # The meter adding the most to the chance of being fired, or the one closest to adding to it
+    return max(range(len(METERS)), key=lambda i: (CUTOFFS[i] - meters[i]) * STEPS[i])
+
+
+class WeakestMeterSelector:
+    # Leans toward scenarios that can raise whichever meter is hurting the player most, and doesn't repeat scenarios
+    # within a run. Draws that come up with one already shown get redrawn, so once three quarters of the pack has
+    # been shown the run's history is forgotten to keep redraws rare.
+    predictable = False  # Depends on the meters, which aren't known until the quarter before ends
+
+    def __init__(self, count: int, boost: float = WEAKEST_METER_BOOST):
+        check_count(count)
+        self.boost = boost
+        self.seen: Set[int] = set()
+
+    def draw(self, game, rng) -> List[int]:
+        count = len(game.scenarios)
+        if count - len(self.seen) < max(DRAWS_PER_QUARTER, count // 4):
+            self.seen.clear()
+        table = scenario_index(game).weighted_toward(weakest_meter(game.meters), self.boost)
+        drawn = []
+        while len(drawn) < DRAWS_PER_QUARTER:
+            index = table.sample(rng)
+            if index not in self.seen:
+                self.seen.add(index)
+                drawn.append(index)
+        return drawn
+
+
+# Every way to draw scenarios, by name. Recordings store the position in this tuple.
+SELECTORS = (
+    ("random", UniformSelector),
+    ("deck", DeckSelector),
+    ("weakest", WeakestMeterSelector)
+)
+SELECTOR_NAMES = tuple(name for name, _ in SELECTORS)
+
+
+def make_selector(name: str, count: int):
+    # A new selector of the given name, for a game with count scenarios
+    return dict(SELECTORS)[name](count)
@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import sys
+import traceback
+from pathlib import Path
+from time import monotonic
+from typing import Any, Dict, Optional, Sequence
+
+from consts import *
+from engine import GameEngine, load_scenarios, Scenario
+from selection import make_selector, SELECTOR_NAMES
+
+# Serves the game's rules to many players at once, for a web front end to put a face on. One process holds every
+# session in memory on one asyncio loop, nothing of pygame involved. The scenarios get loaded once and shared by
+# every session, read only, so a session is just a GameEngine with its own RNG and a few more slots.
+#
+# Sessions are seeded, and play out exactly like `main.py --seed` with the same draws would. The game's rules never
+# wait on anything, so requests get handled right on the loop, one at a time.
+#
+# Requests and responses are JSON objects, either one per line over a plain socket (TCP or Unix) or with --http as the
+# body of POST requests. Every request has an "op":
+#   new           {"seed"?: int, "draws"?: str}  starts a session, with a random seed unless one is given
+#   state         {"session": str}
+#   choose        {"session": str, "prompt": 0-3, "choice": 0, 1 or null}
+#   next_quarter  {"session": str}  once every prompt has a choice
+#   close         {"session": str}
+#   stats         how many sessions there are and how much memory the process holds
+# Responses carry the session's state, or {"error": str}. Scenarios only come along when they change: from new,
+# state and next_quarter.
+
+SESSION_IDLE_TIMEOUT = 30 * 60  # Seconds without a request before a session gets dropped
+MAX_SESSIONS = 100_000
+MAX_REQUEST_BYTES = 64 * 1024
+
+
+class RequestError(Exception):
+    pass
+
+
+class Session(GameEngine):
+    __slots__ = ("id", "seed", "draws", "last_active")
+
+    def __init__(self, scenarios: Sequence[Scenario], seed: int, draws: str):
+        super().__init__(scenarios, random.Random(seed), make_selector(draws, len(scenarios)))
+        self.id = secrets.token_urlsafe(12)
+        self.seed = seed
+        self.draws = draws
+        self.last_active = monotonic()
+        self.draw_scenarios()
+
+    def state(self, scenarios=False) -> Dict[str, Any]:
+        state = {
+            "session": self.id,
+            "year": self.year,
+            "quarter": self.quarter,
+            "fired": self.fired,
+            "chance_of_being_fired": self.chance_of_being_fired,
+            "meters": dict(zip(METERS, self.meters)),
+            "meters_delta": dict(zip(METERS, self.meters_delta)),
+            "choices": [0 if self.selected(prompt * 2) else 1 if self.selected(prompt * 2 + 1) else None
+                        for prompt in range(len(self.current_indices))]
+        }
+        if scenarios:
+            state["scenarios"] = [scenario_json(index, self.scenarios[index]) for index in self.current_indices]
+        return state
+
+
+def scenario_json(index: int, scenario: Scenario) -> Dict[str, Any]:
+    return {
+        "index": index,
+        "text": scenario[SCENARIO_TEXT],
+        "choices": [scenario[CHOICE_ONE], scenario[CHOICE_TWO]],
+        "results": [dict(scenario[CHOICE_ONE_RESULTS]), dict(scenario[CHOICE_TWO_RESULTS])]
+    }
+
+
+def resident_bytes() -> Optional[int]:
+    # The process's resident memory, where the platform says
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # The peak rather than the current size, close enough
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class SessionServer:
+    def __init__(self, scenarios: Sequence[Scenario], idle_timeout: float = SESSION_IDLE_TIMEOUT,
+                 max_sessions: int = MAX_SESSIONS):
+        self.scenarios = scenarios
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.sessions: Dict[str, Session] = {}
+        self.requests = 0
+
+    def handle(self, request: Any) -> Dict[str, Any]:
+        self.requests += 1
+        try:
+            if not isinstance(request, dict):
+                raise RequestError("Requests have to be JSON objects")
+            op = request.get("op")
+            if op == "new":
+                return self.new_session(request).state(scenarios=True)
+            if op == "stats":
+                return {"sessions": len(self.sessions), "requests": self.requests, "resident_bytes": resident_bytes()}
+
+            session = self.session(request)
+            if op == "state":
+                return session.state(scenarios=True)
+            if op == "choose":
+                prompt, choice = request.get("prompt"), request.get("choice")
+                if type(prompt) is not int or not 0 <= prompt < len(session.current_indices):
+                    raise RequestError("prompt has to be one of the prompts on offer")
+                if choice not in (0, 1, None) or type(choice) is bool:
+                    raise RequestError("choice has to be 0, 1 or null")
+                session.choose(prompt, choice)
+                return session.state()
+            if op == "next_quarter":
+                if session.fired:
+                    raise RequestError("Game over, start a new session to play again")
+                if not session.ready_for_next_round():
+                    raise RequestError("Every prompt needs a choice first")
+                session.end_quarter()
+                if not session.fired:
+                    session.draw_scenarios()
+                return session.state(scenarios=True)
+            if op == "close":
+                del self.sessions[session.id]
+                return {"closed": session.id}
+            raise RequestError(f"Unknown op {op!r}")
+        except RequestError as e:
+            return {"error": str(e)}
+
+    def new_session(self, request: Dict[str, Any]) -> Session:
+        if len(self.sessions) >= self.max_sessions:
+            raise RequestError("Too many sessions, try again later")
+        seed = request.get("seed")
+        if seed is None:
+            seed = random.getrandbits(64)
+        elif type(seed) is not int or not 0 <= seed < 2 ** 64:
+            raise RequestError("seed has to fit in 64 bits, and can't be negative")
+        draws = request.get("draws", "random")
+        if draws not in SELECTOR_NAMES:
+            raise RequestError(f"draws has to be one of {', '.join(SELECTOR_NAMES)}")
+        try:
+            session = Session(self.scenarios, seed, draws)
+        except ValueError as e:  # Too few scenarios to draw from
+            raise RequestError(str(e))
+        self.sessions[session.id] = session
+        return session
+
+    def session(self, request: Dict[str, Any]) -> Session:
+        id = request.get("session")
+        if not isinstance(id, str):
+            raise RequestError("session has to be a session's id")
+        session = self.sessions.get(id)
+        if session is None:
+            raise RequestError("No such session, it might have expired")
+        session.last_active = monotonic()
+        return session
+
+    def expire(self):
+        cutoff = monotonic() - self.idle_timeout
+        for id in [id for id, session in self.sessions.items() if session.last_active < cutoff]:
+            del self.sessions[id]
+
+    async def expire_idle(self):
+        while True:
+            await asyncio.sleep(min(60.0, self.idle_timeout))
+            self.expire()
+
+    def respond(self, body: bytes) -> bytes:
+        try:
+            request = json.loads(body)
+        except (ValueError, RecursionError):  # RecursionError for arrays nested thousands deep
+            response = {"error": "Not JSON"}
+        else:
+            try:
+                response = self.handle(request)
+            except Exception as e:  # A bug, but only this request's problem, the connection and server carry on
+                traceback.print_exc()
+                response = {"error": f"Internal error: {type(e).__name__}"}
+        return json.dumps(response, separators=(",", ":")).encode()
+
+    async def serve_lines(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # One request per line, one response line for each
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # Longer than the stream's limit
+                    writer.write(b'{"error":"Request too long"}\n')
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    writer.write(self.respond(line) + b"\n")
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Just enough HTTP/1.1 for a front end to POST requests to, with keep-alive
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                headers = {}
+                for header in header_lines:
+                    name, _, value = header.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                method = request_line.split(" ", 1)[0]
+                length = int(headers.get("content-length") or 0)
+                if method != "POST":
+                    status, body = "405 Method Not Allowed", b'{"error":"POST a JSON request"}'
+                elif not 0 < length <= MAX_REQUEST_BYTES:
+                    status, body = "413 Payload Too Large", b'{"error":"Request too long or empty"}'
+                else:
+                    status, body = "200 OK", self.respond(await reader.readexactly(length))
+                keep_alive = headers.get("connection", "").lower() != "close" and status == "200 OK"
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}"
+                             f"\r\n\r\n".encode() + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0, unix: Optional[Path] = None,
+                    http=False) -> asyncio.AbstractServer:
+        handler = self.serve_http if http else self.serve_lines
+        if unix is not None:
+            return await asyncio.start_unix_server(handler, unix, limit=MAX_REQUEST_BYTES)
+        return await asyncio.start_server(handler, host, port, limit=MAX_REQUEST_BYTES)
+
+
+def server_address(server: asyncio.AbstractServer) -> str:
+    address = server.sockets[0].getsockname()
+    return address if isinstance(address, str) else f"{address[0]}:{address[1]}"
+
+
+async def serve(args: argparse.Namespace):
+    game_server = SessionServer(load_scenarios(args.scenarios), args.idle_timeout, args.max_sessions)
+    server = await game_server.start(args.host, args.port, args.unix, args.http)
+    print(f"Serving {'HTTP' if args.http else 'JSON lines'} on {server_address(server)}", flush=True)
+    expiry = asyncio.create_task(game_server.expire_idle())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        expiry.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the game's rules to many players at once, without pygame")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8750, help="TCP port to listen on, 0 for any free one")
+    parser.add_argument("--unix", type=Path, metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--http", action="store_true", help="take requests as HTTP POST bodies instead of JSON lines")
+    parser.add_argument("--scenarios", type=Path, default=ASSETS_DIR / "scenarios.json", help="scenarios JSON or pack")
+    parser.add_argument("--idle-timeout", type=float, default=SESSION_IDLE_TIMEOUT, metavar="SECONDS",
+                        help="drop sessions that haven't had a request for this long")
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS, help="refuse new sessions past this many")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+from typing import Callable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from consts import *
+from engine import Scenario
+from scenario_pack import ScenarioPack
+
+# Batched version of the rules in engine.GameEngine. Thousands of games advance in lockstep, one row per game, with the
+# meters in a (games, 4) array ordered like consts.METERS. Scenario draws, fire chances and the end of year dice rolls
+# are all vectorized across games.
+
+
+def effect_matrix(scenarios: Sequence[Scenario]) -> np.ndarray:
+    # (scenarios, 2 choices, 4 meters) array of meter changes. Packs already store exactly that, so use it in place.
+    if isinstance(scenarios, ScenarioPack):
+        return np.frombuffer(scenarios.effects, dtype=np.int8).reshape(len(scenarios), 2, len(METERS))
+    return np.array([
+        [[scenario[results][meter] for meter in METERS] for results in (CHOICE_ONE_RESULTS, CHOICE_TWO_RESULTS)]
+        for scenario in scenarios
+    ], dtype=np.int32)
+
+
+def fire_chance(meters: np.ndarray) -> np.ndarray:
+    # Same as GameEngine.get_fire_chance, over the last axis
+    below = np.array(CUTOFFS, dtype=np.float64) - meters
+    steps = np.array(STEPS, dtype=np.float64)
+    return np.where(below > 0, below * steps, below * (steps / 2)).sum(axis=-1)
+
+
+# A policy gets the simulation, plus the (games, 4) meters and (games, 4) scenario indices drawn this quarter for the
+# games still running. It returns a (games, 4) array of choices, 0 for the left button and 1 for the right one.
+Policy = Callable[["BatchSimulation", np.ndarray, np.ndarray], np.ndarray]
+
+
+def random_policy(sim: "BatchSimulation", _: np.ndarray, draws: np.ndarray) -> np.ndarray:
+    return sim.rng.integers(0, 2, size=draws.shape, dtype=np.int8)
+
+
+# All 16 ways of answering four prompts, as a (16, 4) array of choices
+ALL_CHOICES = (np.arange(16)[:, None] >> np.arange(4)) & 1
+
+
+def greedy_policy(sim: "BatchSimulation", meters: np.ndarray, draws: np.ndarray) -> np.ndarray:
+    # Pick whichever combination of choices leaves the lowest chance of being fired after this quarter
+    drawn = sim.effects[draws]  # (games, 4 prompts, 2 choices, 4 meters)
+    after = meters[:, None, :] + drawn[:, 0, ALL_CHOICES[:, 0]]
+    for prompt in range(1, 4):
+        after += drawn[:, prompt, ALL_CHOICES[:, prompt]]  # (games, 16, 4)
+    np.minimum(after, 100, out=after)
+    best = fire_chance(after).argmin(axis=1)
+    return ALL_CHOICES[best]
+
+
+class BatchSimulation:
+    def __init__(self, scenarios: Sequence[Scenario], games: int, seed: Optional[int] = None,
+                 effects: Optional[np.ndarray] = None):
+        self.effects = effects if effects is not None else effect_matrix(scenarios)
+        self.games = games
+        self.rng = np.random.default_rng(seed)
+
+        # Every game starts where GameEngine does
+        self.year = 1
+        self.quarter = 1
+        self.meters = np.full((games, len(METERS)), 50, dtype=np.int32)
+        self.alive = np.ones(games, dtype=bool)
+        self.years_survived = np.zeros(games, dtype=np.int32)  # Set when a game ends, like the game over screen
+
+    def draw(self, games: int) -> np.ndarray:
+        # Four distinct scenarios per game. Drawing with replacement and redrawing the rows that repeated is far cheaper
+        # than a permutation per game, unless there are so few scenarios that repeats are common.
+        count = len(self.effects)
+        if count < 4:
+            raise ValueError("Need at least 4 scenarios to play")
+        if count < 16:
+            return self.rng.random((games, count)).argpartition(4, axis=1)[:, :4]
+
+        draws = self.rng.integers(0, count, size=(games, 4))
+        while True:
+            a, b, c, d = draws.T
+            repeated = (a == b) | (a == c) | (a == d) | (b == c) | (b == d) | (c == d)
+            if not repeated.any():
+                return draws
+            draws[repeated] = self.rng.integers(0, count, size=(repeated.sum(), 4))
+
+    def step(self, policy: Policy = random_policy) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Play one quarter in every game still running. Returns the indices of those games, the scenarios they drew
+        # and the choices they made.
+        running = np.flatnonzero(self.alive)
+        meters = self.meters[running]
+        draws = self.draw(len(running))
+        choices = policy(self, meters, draws)
+        meters = np.minimum(meters + self.effects[draws, choices].sum(axis=1), 100)
+        self.meters[running] = meters
+
+        self.quarter += 1
+        if self.quarter >= 5:
+            # Roll the dice!
+            rolls = self.rng.random(len(running))
+            if self.year != 1:
+                fired = running[rolls < fire_chance(meters) / 100]
+                self.years_survived[fired] = self.year
+                self.alive[fired] = False
+            self.quarter = 1
+            self.year += 1
+        return running, draws, choices
+
+    def run(self, years: int, policy: Policy = random_policy) -> np.ndarray:
+        for _ in range(years * 4):
+            if not self.alive.any():
+                break
+            self.step(policy)
+        self.years_survived[self.alive] = self.year - 1
+        return self.years_survived
+
+    def survival_rate(self) -> float:
+        return self.alive.mean()
@@ -0,0 +1,425 @@
+import argparse
+import hashlib
+import itertools
+import os
+import pickle
+import sys
+from math import comb
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from consts import *
+from engine import load_scenarios, Scenario
+from simulation import ALL_CHOICES, effect_matrix, fire_chance
+
+# Exact expectimax over the game's rules (engine.GameEngine). A state is (meters, quarter, year) at the start of a
+# quarter, before its scenarios are drawn. Its value is the probability of still being CEO after the board review at
+# the end of the horizon year, when every quarter's choices are made to maximize that same probability.
+#
+# Compression, none of which changes any value:
+#   - Meters are capped at 100 by the rules, so everything above collapses onto 100.
+#   - The value is monotone in every meter (more of a meter never raises the chance of being fired), so a choice that
+#     is no better than the other one on every meter is never needed and gets dropped, and so does any way of
+#     answering a draw's four prompts that another way beats on every meter.
+#   - Draws only matter up to which effects they offer, so the C(scenarios, 4) draws are grouped by the multiset of
+#     distinct scenario effect pairs they contain, weighted by how many draws share it.
+#   - States that are certain to be fired at the next review, or certain to survive every review left, are settled
+#     from bounds on how far meters can move per quarter without searching below them.
+#
+# Solving goes a quarter at a time: first every state the query can reach gets found, quarter by quarter, then the
+# quarters get valued last to first, each one a few big array operations over all of its states at once. Every state
+# still takes an expectation over every group of draws, and a pack like ours has hundreds of thousands of groups, so
+# queries get slower the further they are from the horizon. Queries too big to finish in a few minutes get turned down
+# (see MAX_LOOKUPS). With the bundled scenarios on one core that leaves the second quarter of the horizon year and
+# later: the last quarter takes well under a second, the third about a minute and the second about seven, while the
+# first and anything in the year before would take from a quarter of an hour to many hours. The draw table depends on
+# nothing but the scenarios and gets saved on its own, in the user's cache directory by default, the memo of solved
+# states can be saved too: a query inside one already solved is a lookup.
+
+Meters = Tuple[int, ...]
+Layer = Tuple[np.ndarray, np.ndarray]  # Sorted state keys (see state_keys()) and the values of those states
+
+MEMO_VERSION = 2
+TABLE_VERSION = 2
+TABLE_ARRAYS = ("options", "choices", "counts", "weights", "max_gain", "max_loss")
+STATE_BASE = 1 << 16  # State keys pack each meter, offset by half of this, into 16 bits
+CHUNK_SIZE = 1 << 22  # About how many (state, option) meters to work on at once
+STATES_PER_PASS = 64  # States valued together, and groups of draws per block, sized to make the most of the cache
+GROUP_BLOCK = 512
+GROUPS_PER_CHUNK = 1 << 16  # Groups of draws to work out the options of at once while building the table
+PAD_KEY = np.iinfo(np.int64).max
+
+# Supported limits. Every state is an expectation over every group of draws, so packs with more distinct scenarios
+# than make MAX_GROUPS groups get turned down, and so do queries that would look up more than MAX_LOOKUPS options in
+# total (states to value times options in the draw table). At about 1.5ns a lookup on one core, the default keeps a
+# query under about 8 minutes.
+MAX_GROUPS = 1_000_000
+MAX_LOOKUPS = 3 * 10 ** 11
+
+
+def cache_dir() -> Path:
+    # Where the current user's caches go: things that are slow to make and fine to lose, kept out of the assets
+    if sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local")
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    return base / "AppeasingTheBoard"
+
+
+def meters_tuple(meters: Union[Mapping[str, int], Sequence[int]]) -> Meters:
+    if isinstance(meters, Mapping):
+        return tuple(meters[meter] for meter in METERS)
+    return tuple(meters)
+
+
+def survival(meters: np.ndarray) -> np.ndarray:
+    # Chance of surviving a board review, same as the dice roll in GameEngine.end_quarter
+    return np.clip(1 - fire_chance(meters) / 100, 0, 1)
+
+
+def state_keys(meters: np.ndarray) -> np.ndarray:
+    # One int64 per row of meters, ordered so that equal rows get equal keys
+    keys = np.zeros(meters.shape[:-1], dtype=np.int64)
+    for meter in range(meters.shape[-1]):
+        keys = keys * STATE_BASE + (meters[..., meter].astype(np.int64) + STATE_BASE // 2)
+    return keys
+
+
+def state_meters(keys: np.ndarray) -> np.ndarray:
+    meters = np.empty((len(keys), len(METERS)), dtype=np.int32)
+    for meter in reversed(range(len(METERS))):
+        meters[:, meter] = keys % STATE_BASE - STATE_BASE // 2
+        keys = keys // STATE_BASE
+    return meters
+
+
+def lookup(layer: Layer, keys: np.ndarray) -> np.ndarray:
+    # Values of the given states, every one of which has to be in the layer
+    positions = np.searchsorted(layer[0], keys)
+    return layer[1][positions]
+
+
+def pareto_front(totals: np.ndarray) -> np.ndarray:
+    # (groups, options) mask of the options no other option of their group matches or beats on every meter, keeping
+    # the first of any that are equal
+    ge = (totals[:, :, None, :] >= totals[:, None, :, :]).all(axis=-1)  # [g, i, j]: option i is at least option j
+    first = np.arange(totals.shape[1])
+    beaten = (ge & (~ge.transpose(0, 2, 1) | (first[:, None] < first[None, :]))).any(axis=1)
+    return ~beaten
+
+
+class DrawTable:
+    # Every distinct way a quarter's draw can play out. options holds every meter change a quarter can cause.
+    # choices[group] lists the options worth taking out of those a group of draws offers, padded with len(options),
+    # and groups are sorted by how many they have, so the first counts[n] groups have more than n. weights[group] is
+    # the probability of drawing one of that group's draws.
+    def __init__(self, effects: np.ndarray):
+        # Scenarios that offer the same effects, in either order, are the same as far as the solver is concerned
+        types: Dict[Tuple, int] = {}
+        for left, right in effects.tolist():
+            left, right = tuple(left), tuple(right)
+            if all(a >= b for a, b in zip(left, right)):
+                key = (left, left)
+            elif all(b >= a for a, b in zip(left, right)):
+                key = (right, right)
+            else:
+                key = tuple(sorted((left, right)))
+            types[key] = types.get(key, 0) + 1
+        type_effects = np.array(list(types), dtype=np.int32)  # (types, 2, meters)
+        type_counts = np.array(list(types.values()))
+        if comb(len(types) + 3, 4) > MAX_GROUPS:
+            raise ValueError(f"{len(types)} distinct scenarios make {comb(len(types) + 3, 4)} groups of draws, the "
+                             f"solver supports up to {MAX_GROUPS}")
+
+        # Every multiset of four types, sorted within, and how many draws make it up: the product of C(count, times
+        # drawn) over its distinct types
+        groups = np.fromiter(itertools.chain.from_iterable(
+            itertools.combinations_with_replacement(range(len(type_counts)), 4)), dtype=np.int32).reshape(-1, 4)
+        ways = np.array([[comb(n, k) for k in range(5)] for n in range(type_counts.max() + 1)], dtype=np.float64)
+        weights = np.ones(len(groups))
+        for prompt in range(4):
+            times = (groups == groups[:, prompt:prompt + 1]).sum(axis=1)
+            first = groups[:, prompt] != groups[:, prompt - 1] if prompt else np.ones(len(groups), dtype=bool)
+            weights *= np.where(first, ways[type_counts[groups[:, prompt]], times], 1)
+        drawable = weights > 0
+        groups, weights = groups[drawable], weights[drawable]
+
+        # The keys (see state_keys()) of the meter changes worth taking out of the 16 ways of answering each group's
+        # four prompts, first in each row and padded with a key no meter change has. A chunk of groups at a time,
+        # so the (groups, 16, meters) meter changes never all exist at once.
+        keys = np.full((len(groups), len(ALL_CHOICES)), PAD_KEY, dtype=np.int64)
+        for start in range(0, len(groups), GROUPS_PER_CHUNK):
+            chunk = groups[start:start + GROUPS_PER_CHUNK]
+            totals = type_effects[chunk[:, 0]][:, ALL_CHOICES[:, 0]]
+            for prompt in range(1, 4):
+                totals += type_effects[chunk[:, prompt]][:, ALL_CHOICES[:, prompt]]
+            chunk_keys = np.where(pareto_front(totals), state_keys(totals), PAD_KEY)
+            chunk_keys.sort(axis=1)
+            keys[start:start + len(chunk)] = chunk_keys
+
+        # Only meter changes some group takes are options, which also keeps the states they lead to out of the search
+        kept = (keys != PAD_KEY).sum(axis=1)
+        order = np.argsort(-kept, kind="stable")
+        keys, kept = keys[order], kept[order]
+        width = kept.max()
+        option_keys = np.unique(keys[keys != PAD_KEY])
+        self.options = state_meters(option_keys)
+        self.choices = np.searchsorted(option_keys, keys[:, :width]).astype(np.int32)  # Padding lands past the end
+        self.counts = np.array([(kept > n).sum() for n in range(width)])
+        self.weights = weights[order] / comb(len(effects), 4)
+
+        # Furthest any meter can move up or down in one quarter
+        best = effects.max(axis=1)
+        worst = effects.min(axis=1)
+        self.max_gain = np.sort(best, axis=0)[-4:].sum(axis=0)
+        self.max_loss = np.sort(worst, axis=0)[:4].sum(axis=0)
+
+    def expectation(self, values: np.ndarray) -> np.ndarray:
+        # (states, options) values of ending up with each option -> (states,) expected value of the best option the
+        # draw offers. Goes through the groups a block at a time, so the block's best values so far stay in cache.
+        padded = np.zeros((len(self.options) + 1, len(values)))
+        padded[:-1] = values.T  # Padding is worth nothing, and every value is at least that
+        expected = np.zeros(len(values))
+        for start in range(0, len(self.weights), GROUP_BLOCK):
+            choices = self.choices[start:start + GROUP_BLOCK]
+            best = padded[choices[:, 0]]
+            for n in range(1, len(self.counts)):
+                count = min(self.counts[n] - start, len(choices))
+                if count <= 0:
+                    break
+                np.maximum(best[:count], padded[choices[:count, n]], out=best[:count])
+            expected += self.weights[start:start + GROUP_BLOCK] @ best
+        return expected
+
+    def save(self, path: Path, digest: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as fp:
+            np.savez(fp, digest=np.array(digest), **{name: getattr(self, name) for name in TABLE_ARRAYS})
+
+    @classmethod
+    def load(cls, path: Path, digest: str) -> Optional["DrawTable"]:
+        # The table saved at path, if it was made for the same scenarios
+        with np.load(path) as saved:
+            if str(saved["digest"]) != digest:
+                return None
+            table = cls.__new__(cls)
+            for name in TABLE_ARRAYS:
+                setattr(table, name, saved[name])
+        return table
+
+
+class Solver:
+    def __init__(self, scenarios: Sequence[Scenario], horizon: int, memo_path: Optional[Path] = None,
+                 table_path: Optional[Path] = None, max_lookups: Optional[int] = MAX_LOOKUPS):
+        if horizon < 2:
+            raise ValueError("The first board review is at the end of year 2, the horizon can't be before it")
+        if len(scenarios) < 4:
+            raise ValueError("Need at least 4 scenarios to play")
+        self.effects = np.asarray(effect_matrix(scenarios), dtype=np.int32)
+        self.horizon = horizon
+        self.memo_path = memo_path
+
+        # The draw table is only valid for the exact same scenarios, the memo also for the same rules and horizon
+        table_digest = hashlib.sha256(self.effects.tobytes())
+        table_digest.update(repr(TABLE_VERSION).encode())
+        self.table_digest = table_digest.hexdigest()
+        digest = hashlib.sha256(self.effects.tobytes())
+        digest.update(repr((MEMO_VERSION, METERS, METER_CUTOFFS, FIRE_STEPS, horizon)).encode())
+        self.digest = digest.hexdigest()
+
+        self.table: Optional[DrawTable] = None
+        if table_path is not None and table_path.exists():
+            try:
+                self.table = DrawTable.load(table_path, self.table_digest)
+            except (OSError, ValueError, KeyError) as e:  # Damaged, or saved by a version with other arrays
+                print(f"Could not load the draw table from {table_path}: {e}", file=sys.stderr)
+        if self.table is None:
+            self.table = DrawTable(self.effects)
+            if table_path is not None:
+                try:
+                    self.table.save(table_path, self.table_digest)
+                except OSError as e:  # Only costs building it again next time
+                    print(f"Could not save the draw table to {table_path}: {e}", file=sys.stderr)
+
+        # Most states one query may value, None for no limit
+        lookups = int((self.table.choices < len(self.table.options)).sum())
+        self.max_states = None if max_lookups is None else max(1, max_lookups // lookups)
+
+        # Solved states by (quarter, year)
+        self.memo: Dict[Tuple[int, int], Layer] = {}
+        if memo_path is not None and memo_path.exists():
+            with memo_path.open("rb") as fp:
+                saved = pickle.load(fp)
+            if saved["digest"] == self.digest:
+                self.memo = saved["memo"]
+
+    def save(self):
+        with self.memo_path.open("wb") as fp:
+            pickle.dump({"digest": self.digest, "memo": self.memo}, fp, pickle.HIGHEST_PROTOCOL)
+
+    def survival_probability(self, meters, quarter: int, year: int) -> float:
+        # Before this quarter's scenarios are drawn
+        return float(self.values(np.array([meters_tuple(meters)], dtype=np.int32), quarter, year)[0])
+
+    def best_choices(self, meters, quarter: int, year: int, draw: Sequence[Scenario]) -> Tuple[Tuple[int, ...], float]:
+        # Best answer to the four prompts on screen (0 for the left button, 1 for the right one), and the survival
+        # probability that comes with it
+        effects = np.asarray(effect_matrix(draw), dtype=np.int32)
+        totals = effects[np.arange(4), ALL_CHOICES].sum(axis=1)  # (16, meters)
+        values = self.after_values(np.array([meters_tuple(meters)], dtype=np.int32), quarter, year, totals)[0]
+        best = int(values.argmax())
+        return tuple(int(choice) for choice in ALL_CHOICES[best]), float(values[best])
+
+    def values(self, meters: np.ndarray, quarter: int, year: int, solved=False) -> np.ndarray:
+        # Values of the (states, meters) states at the start of the given quarter. solved says they're in the memo.
+        if year > self.horizon:
+            return np.ones(len(meters))
+        if not solved:
+            self.solve(meters, quarter, year)
+        return lookup(self.memo[quarter, year], state_keys(meters))
+
+    def after_values(self, meters: np.ndarray, quarter: int, year: int, totals: np.ndarray,
+                     solved=False) -> np.ndarray:
+        # (states, totals) values of ending this quarter with each of the given meter changes
+        after = np.minimum(meters[:, None, :] + totals, 100)
+        if quarter < 4:
+            return self.values(after.reshape(-1, len(METERS)), quarter + 1, year, solved).reshape(after.shape[:2])
+        # End of the year, the board reviews everyone but first year CEOs
+        odds = survival(after) if year != 1 else np.ones(after.shape[:2])
+        if year == self.horizon:
+            return odds
+        return odds * self.values(after.reshape(-1, len(METERS)), 1, year + 1, solved).reshape(after.shape[:2])
+
+    def solve(self, meters: np.ndarray, quarter: int, year: int):
+        # Puts the given states and every state they can lead to in the memo. First finds the states each quarter up
+        # to the horizon has to value, leaving out those already solved and those the bounds settle, then values
+        # them a quarter at a time, last to first. Raises ValueError, before valuing anything, if that's more than
+        # max_states states.
+        too_many = ValueError(f"Solving from quarter {quarter} of year {year} needs more than {self.max_states} states "
+                              f"valued, more than the solver is set to take on")
+        layers: List[Tuple[int, int, np.ndarray, np.ndarray]] = []
+        needed = 0
+        keys = np.unique(state_keys(meters))
+        while year <= self.horizon and len(keys):
+            keys = self.unsolved(keys, quarter, year)
+            values = self.settled(state_meters(keys), quarter, year)
+            needed += int(np.isnan(values).sum())
+            if self.max_states is not None and needed > self.max_states:
+                raise too_many
+            layers.append((quarter, year, keys, values))
+            next_quarter, next_year = (quarter + 1, year) if quarter < 4 else (1, year + 1)
+            limit = None if self.max_states is None else self.max_states - needed
+            keys = self.successors(keys[np.isnan(values)], next_quarter, next_year, limit)
+            if keys is None:
+                raise too_many
+            quarter, year = next_quarter, next_year
+
+        for quarter, year, keys, values in reversed(layers):
+            pending = np.flatnonzero(np.isnan(values))
+            for start in range(0, len(pending), STATES_PER_PASS):
+                states = pending[start:start + STATES_PER_PASS]
+                after = self.after_values(state_meters(keys[states]), quarter, year, self.table.options, solved=True)
+                # When every option is worth the same, say fired whatever happens, the draw makes no difference
+                low, high = after.min(axis=1), after.max(axis=1)
+                same = low == high
+                values[states[same]] = low[same]
+                values[states[~same]] = self.table.expectation(after[~same])
+            self.remember(quarter, year, keys, values)
+
+    def unsolved(self, keys: np.ndarray, quarter: int, year: int) -> np.ndarray:
+        layer = self.memo.get((quarter, year))
+        if layer is None:
+            return keys
+        return keys[~np.isin(keys, layer[0], assume_unique=True)]
+
+    def successors(self, keys: np.ndarray, quarter: int, year: int,
+                   limit: Optional[int] = None) -> Optional[np.ndarray]:
+        # Every state the given ones can end the quarter in, the next one being the given quarter. None as soon as it's
+        # clear more than limit of them need valuing, so a query too big to take on gets turned down early.
+        meters = state_meters(keys)
+        found = [np.empty(0, dtype=np.int64)]
+        step = max(1, CHUNK_SIZE // len(self.table.options))
+        for start in range(0, len(meters), step):
+            after = np.minimum(meters[start:start + step, None, :] + self.table.options, 100)
+            found.append(np.unique(state_keys(after)))
+            if limit is not None and year <= self.horizon:
+                new = self.unsolved(found[-1], quarter, year)
+                if np.isnan(self.settled(state_meters(new), quarter, year)).sum() > limit:
+                    return None
+        return np.unique(np.concatenate(found))
+
+    def remember(self, quarter: int, year: int, keys: np.ndarray, values: np.ndarray):
+        layer = self.memo.get((quarter, year))
+        if layer is not None:
+            keys = np.concatenate([layer[0], keys])
+            values = np.concatenate([layer[1], values])
+            order = np.argsort(keys, kind="stable")
+            keys, values = keys[order], values[order]
+        self.memo[quarter, year] = (keys, values)
+
+    def settled(self, meters: np.ndarray, quarter: int, year: int) -> np.ndarray:
+        # Values of the states the bounds settle, NaN for the rest. Quarters until the next review that counts:
+        quarters = 5 - quarter + (4 if year == 1 else 0)
+        values = np.full(len(meters), np.nan)
+
+        # Safe for sure if every review left goes fine even when every meter loses as much as it possibly can
+        quarters_left = quarters + (self.horizon - max(year, 2)) * 4
+        worst = meters + quarters_left * np.minimum(self.table.max_loss, 0)
+        values[survival(worst) >= 1] = 1.0
+
+        # Fired for sure if the next review goes badly even when every meter gains as much as it possibly can
+        best = np.minimum(meters + quarters * self.table.max_gain, 100)
+        values[survival(best) <= 0] = 0.0
+        return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exact survival probabilities and best choices")
+    parser.add_argument("--scenarios", type=Path, default=ASSETS_DIR / "scenarios.json", help="scenarios JSON or pack")
+    parser.add_argument("--horizon", type=int, default=2, help="survive the board review at the end of this year")
+    parser.add_argument("--meters", type=int, nargs=4, default=(50, 50, 50, 50),
+                        help="cash, morale, productivity and reputation")
+    parser.add_argument("--quarter", type=int, default=4)
+    parser.add_argument("--year", type=int, default=2)
+    parser.add_argument("--draw", type=int, nargs=4, help="indices of the four scenarios on screen")
+    parser.add_argument("--table", type=Path,
+                        help="load the draw table from here, or build and save it here [default: the scenarios' "
+                             "name with the suffix .draws, in the user's cache directory]")
+    parser.add_argument("--memo", type=Path, help="load and save the memo table here")
+    parser.add_argument("--max-lookups", type=float, default=MAX_LOOKUPS,
+                        help="turn down queries that would look up more options than this, 0 for no limit. The "
+                             "default is several minutes' worth.")
+    args = parser.parse_args()
+    if not 1 <= args.quarter <= 4 or args.year < 1:
+        parser.error("--quarter goes from 1 to 4, --year from 1")
+    if args.max_lookups < 0:
+        parser.error("--max-lookups can't be negative")
+
+    scenarios = load_scenarios(args.scenarios)
+    table_path = args.table or cache_dir() / args.scenarios.with_suffix(".draws").name
+    try:
+        solver = Solver(scenarios, args.horizon, args.memo, table_path, int(args.max_lookups) or None)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    try:
+        if args.draw:
+            draw = [scenarios[i] for i in args.draw]
+            choices, chance = solver.best_choices(args.meters, args.quarter, args.year, draw)
+            print(f"Best choices: {', '.join('left' if choice == 0 else 'right' for choice in choices)}")
+        else:
+            chance = solver.survival_probability(args.meters, args.quarter, args.year)
+    except ValueError as e:  # Too big a query
+        sys.exit(f"{e}. Start from a later quarter, or raise --max-lookups.")
+    print(f"Survival probability: {chance:.6f}")
+
+    if args.memo:
+        solver.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,65 @@
-from typing import Any, Callable, Dict, Tuple, Union
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
-from pygame import image, mouse, Rect, Surface
-from pygame.font import Font, SysFont
+from pygame import Rect, Surface, transform
+from pygame.font import Font
 from pygame.locals import SRCALPHA
-from pygame.mixer import init, Sound
+from pygame.mixer import Sound
 from pygame.sprite import Sprite
 
+from assets import CONVERT, CONVERT_ALPHA, load_image
+from audio import audio
 from consts import *
-
-# Setup the click sound effect
-init()  # Make sure mixer is initialized before doing this
-button_click_sound = Sound(ASSETS_DIR / "sounds" / "click.ogg")
-button_click_sound.set_volume(0.3)
+from fonts import get_font
+import scaling
+from scaling import mouse_pos, render_text
+
+# Images each screen is built from, so they can be loaded before the screen is first shown
+SCREEN_IMAGES = {
+    "TITLE_SCREEN": [
+        (ASSETS_DIR / "title.png", CONVERT_ALPHA),
+        (ASSETS_DIR / "buttons" / "play_up.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "play_hover.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "soundon_up.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "soundon_hover.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "soundoff_up.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "soundoff_hover.png", CONVERT)
+    ],
+    "INSTRUCTIONS": [],  # Same buttons as the title screen
+    "GAMEPLAY": [
+        (ASSETS_DIR / "meters" / "background.png", CONVERT),
+        (ASSETS_DIR / "meters" / "cash.png", CONVERT),
+        (ASSETS_DIR / "meters" / "morale.png", CONVERT),
+        (ASSETS_DIR / "meters" / "productivity.png", CONVERT),
+        (ASSETS_DIR / "meters" / "reputation.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "prompt_up.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "prompt_hover.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "prompt_select.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "nextquarter_disabled.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "nextquarter_up.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "nextquarter_hover.png", CONVERT)
+    ],
+    "GAME_OVER": [
+        (ASSETS_DIR / "buttons" / "playagain_up.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "playagain_hover.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "exit_up.png", CONVERT),
+        (ASSETS_DIR / "buttons" / "exit_hover.png", CONVERT)
+    ]
+}
+
+# Sound effects, only decoded once something asks for them (the mixer has to be initialized by then)
+CLICK_SOUND = ASSETS_DIR / "sounds" / "click.ogg"
+SOUNDS = [(CLICK_SOUND, None)]
+
+
+def load_click_sound() -> Sound:
+    return audio.sound(CLICK_SOUND, 0.3)
 
 
 def play_click_sound(gamestate):
     if not gamestate.muted:
-        button_click_sound.play()
+        audio.play_ui(load_click_sound())
 
 
 class Meter(Sprite):
@@ -24,52 +67,68 @@ class Meter(Sprite):
         super().__init__()
 
         # Meter surfaces
-        self.bg_surf = image.load(ASSETS_DIR / "meters" / "background.png").convert()
-        self.fg_surf = image.load(ASSETS_DIR / "meters" / meter_image).convert()
+        self.bg_surf = load_image(ASSETS_DIR / "meters" / "background.png")
+        self.fg_surf = load_image(ASSETS_DIR / "meters" / meter_image)
 
         # Meter position
         self.rect = self.bg_surf.get_rect(topleft=meter_pos)  # bg_rect, called rect for external use purposes
         self.fg_rect = self.fg_surf.get_rect(topleft=meter_pos)
 
         # Meter title
-        self.font = SysFont(VERDANA, 24)
-        self.text = self.font.render(meter_text, True, FONT_COLOR)
+        self.font = get_font(VERDANA, 24)
+        self.text = render_text(self.font, meter_text, FONT_COLOR)
         self.text_rect = self.text.get_rect(topleft=(meter_pos[0], meter_pos[1] + self.rect.h))
 
-        # Meter type
+        # Meter type, and where the game's meter arrays keep it
         self.type = meter_type
+        self.index = METERS.index(meter_type)
+
+        # Fill and readout of the (value, delta) last drawn, see update_readout()
+        self.readout_state: Optional[Tuple[int, int]] = None
 
     def draw(self, screen, gamestate):
+        state = self.render_state(gamestate)
+        if state != self.readout_state:
+            self.update_readout(*state)
+
         # Blit the meter
         screen.blit(self.bg_surf, self.rect)
-        screen.blit(self.fg_surf, self.fg_rect, self.fg_surf.get_rect(
-            w=self.fg_surf.get_width() * (gamestate.meters[self.type] / 100)
-        ))
+        screen.blit(self.fg_surf, self.fg_rect, self.fill_area)
 
-        # Blit the title
+        # Blit the title and the current value and delta
         screen.blit(self.text, self.text_rect)
+        screen.blit(self.readout, self.readout_rect)
+
+    def update_readout(self, value: int, delta: int):
+        # The meter only changes when a choice is picked or a quarter ends, so its fill and text get worked out then
+        # instead of on every draw
+        self.readout_state = (value, delta)
+        self.fill_area = self.fg_surf.get_rect(w=self.fg_surf.get_width() * (value / 100))
+
+        # Build the text of the current value and delta of the meter
+        meter_text = f"{value} / 100"
+        if delta > 0:
+            meter_text += f" (+{delta})"
+        elif delta < 0:
+            meter_text += f" ({delta})"
+        self.readout = render_text(self.font, meter_text, FONT_COLOR)
+        self.readout_rect = self.readout.get_rect(center=self.rect.center)
 
-        # Build and blit the current value and delta of the meter
-        meter_text = f"{gamestate.meters[self.type]} / 100"
-        if gamestate.meters_delta[self.type] > 0:
-            meter_text += f" (+{gamestate.meters_delta[self.type]})"
-        elif gamestate.meters_delta[self.type] < 0:
-            meter_text += f" ({gamestate.meters_delta[self.type]})"
-        meter_text_surf = self.font.render(meter_text, True, FONT_COLOR)
-        screen.blit(meter_text_surf, meter_text_surf.get_rect(center=self.rect.center))
+    def render_state(self, gamestate):
+        return gamestate.meters[self.index], gamestate.meters_delta[self.index]
 
 
 class PromptChoice(Sprite):
     def __init__(self, button_pos: Tuple[int, int], id: int, scenario_text: str, scenario_res: Dict[str, int]):
         super().__init__()
 
-        # Used to index into the GameState.button_states array later
+        # The button's bit in GameState.button_mask
         self.id = id
 
         # The surfaces for the three button states
-        self.unselected_surf = image.load(ASSETS_DIR / "buttons" / "prompt_up.png").convert()
-        self.hovered_surf = image.load(ASSETS_DIR / "buttons" / "prompt_hover.png").convert()
-        self.selected_surf = image.load(ASSETS_DIR / "buttons" / "prompt_select.png").convert()
+        self.unselected_surf = load_image(ASSETS_DIR / "buttons" / "prompt_up.png")
+        self.hovered_surf = load_image(ASSETS_DIR / "buttons" / "prompt_hover.png")
+        self.selected_surf = load_image(ASSETS_DIR / "buttons" / "prompt_select.png")
 
         # Position of button (same for all three states)
         self.rect = self.unselected_surf.get_rect(topleft=button_pos)
@@ -78,20 +137,18 @@ class PromptChoice(Sprite):
         self.hovered = False
 
         # Prompt text attached to buttons
-        font = SysFont(VERDANA, 16)
+        font = get_font(VERDANA, 16)
         inner_rect = self.rect.inflate(-36, -36)  # Shrink by 18px on all sides, still centered on button
         text_rect = inner_rect.inflate(0, -48).move(0, -18)  # Create gap on bottom, move to keep it centered
         self.text = TextAreaWrapped(text_rect, scenario_text, font, DARKER_FONT_COLOR)
 
         # Scenario results
-        self.res = scenario_res
         res_rect = Rect(inner_rect.left, text_rect.bottom, inner_rect.width, inner_rect.height - text_rect.height)
-        res_str = ", ".join(f"{METERS_SHORTHAND[k]}: {'+' if v > 0 else ''}{v}" for k, v in self.res.items() if v != 0)
-        self.res_textarea = TextAreaWrapped(res_rect, res_str, font, WHITE, centered=True)
+        self.res_textarea = TextAreaWrapped(res_rect, results_text(scenario_res), font, WHITE, centered=True)
 
     def draw(self, screen, gamestate):
         # Blit the button
-        if gamestate.button_states[self.id]:
+        if gamestate.selected(self.id):
             screen.blit(self.selected_surf, self.rect)
         elif self.hovered:
             screen.blit(self.hovered_surf, self.rect)
@@ -102,16 +159,19 @@ class PromptChoice(Sprite):
         self.text.draw(screen, gamestate)
         self.res_textarea.draw(screen, gamestate)
 
-    def set_selected(self, gamestate, state):
-        if gamestate.button_states[self.id] != state:  # Only do work if we are actually changing our state
-            if gamestate.button_states[self.id]:       # If we were originally selected
-                gamestate.button_states[self.id] = False
-                for meter in gamestate.meters:
-                    gamestate.meters_delta[meter] -= self.res[meter]
-            else:
-                gamestate.button_states[self.id] = True
-                for meter in gamestate.meters:
-                    gamestate.meters_delta[meter] += self.res[meter]
+    def reskin(self, scenario_text: str, scenario_res: Dict[str, int]):
+        # Show another choice on the same button
+        self.text.set_text(scenario_text)
+        self.res_textarea.set_text(results_text(scenario_res))
+
+    def prerender(self, scenario_text: str, scenario_res: Dict[str, int]) -> Iterator[None]:
+        self.text.prerender(scenario_text)
+        yield
+        self.res_textarea.prerender(results_text(scenario_res))
+        yield
+
+    def set_hovered(self, hovered: bool):
+        self.hovered = hovered
 
 
 class Prompt(Sprite):
@@ -126,7 +186,7 @@ class Prompt(Sprite):
         self.buttons_rect = self.left_button.rect.union(self.right_button.rect)
 
         # Build the text area
-        prompt_font = SysFont(VERDANA, 20)
+        prompt_font = get_font(VERDANA, 20)
         self.prompt_text = TextAreaWrapped(
             Rect(PROMPT_X_POS, y_pos, self.buttons_rect.left - 10 - PROMPT_X_POS, self.buttons_rect.h),
             scenario[SCENARIO_TEXT], prompt_font, FONT_COLOR
@@ -135,20 +195,44 @@ class Prompt(Sprite):
         # Union their rects together to make an all-encompassing rect
         self.rect = self.buttons_rect.union(self.prompt_text.rect)
 
+    def reskin(self, scenario: Dict[str, Union[str, Dict[str, int]]]):
+        # Show another scenario in the same spot, without building any new sprites
+        self.prompt_text.set_text(scenario[SCENARIO_TEXT])
+        self.left_button.reskin(scenario[CHOICE_ONE], scenario[CHOICE_ONE_RESULTS])
+        self.right_button.reskin(scenario[CHOICE_TWO], scenario[CHOICE_TWO_RESULTS])
+
+    def prerender(self, scenario: Dict[str, Union[str, Dict[str, int]]]) -> Iterator[None]:
+        # Renders everything reskin() needs for the scenario ahead of time, one paragraph per step
+        self.prompt_text.prerender(scenario[SCENARIO_TEXT])
+        yield
+        yield from self.left_button.prerender(scenario[CHOICE_ONE], scenario[CHOICE_ONE_RESULTS])
+        yield from self.right_button.prerender(scenario[CHOICE_TWO], scenario[CHOICE_TWO_RESULTS])
+
     def draw(self, screen, gamestate):
         self.prompt_text.draw(screen, gamestate)
         self.left_button.draw(screen, gamestate)
         self.right_button.draw(screen, gamestate)
 
+    def render_state(self, gamestate):
+        return (gamestate.selected(self.left_button.id), gamestate.selected(self.right_button.id),
+                self.left_button.hovered, self.right_button.hovered)
+
     def handle_click(self, gamestate, pos: Tuple[int, int]):
         if self.buttons_rect.collidepoint(pos):
-            self.left_button.set_selected(gamestate, self.left_button.rect.collidepoint(pos))
-            self.right_button.set_selected(gamestate, self.right_button.rect.collidepoint(pos))
+            # Clicking the gap between the buttons clears the prompt
+            if self.left_button.rect.collidepoint(pos):
+                choice = 0
+            elif self.right_button.rect.collidepoint(pos):
+                choice = 1
+            else:
+                choice = None
+            gamestate.choose(self.left_button.id // 2, choice)
             play_click_sound(gamestate)
 
-    def handle_hover(self, pos: Tuple[int, int]):
-        self.left_button.hovered = self.left_button.rect.collidepoint(pos)
-        self.right_button.hovered = self.right_button.rect.collidepoint(pos)
+    def register_input(self, router):
+        router.add_click(self.buttons_rect, self.handle_click)
+        router.add_hover(self.left_button.rect, self.left_button.set_hovered)
+        router.add_hover(self.right_button.rect, self.right_button.set_hovered)
 
 
 class NextRound(Sprite):
@@ -156,12 +240,12 @@ class NextRound(Sprite):
         super().__init__()
 
         # Next round buttons
-        self.disabled_surf = image.load(ASSETS_DIR / "buttons" / "nextquarter_disabled.png").convert()
-        self.unhovered_surf = image.load(ASSETS_DIR / "buttons" / "nextquarter_up.png").convert()
-        self.hovered_surf = image.load(ASSETS_DIR / "buttons" / "nextquarter_hover.png").convert()
+        self.disabled_surf = load_image(ASSETS_DIR / "buttons" / "nextquarter_disabled.png")
+        self.unhovered_surf = load_image(ASSETS_DIR / "buttons" / "nextquarter_up.png")
+        self.hovered_surf = load_image(ASSETS_DIR / "buttons" / "nextquarter_hover.png")
 
         self.rect = self.unhovered_surf.get_rect(topleft=(10, 75))  # Next round position
-        self.hovered = self.rect.collidepoint(mouse.get_pos())  # Whether or not the player is hovering over the button
+        self.hovered = self.rect.collidepoint(mouse_pos())  # Whether or not the player is hovering over the button
 
     def draw(self, screen, gamestate):
         if gamestate.ready_for_next_round():
@@ -172,22 +256,32 @@ class NextRound(Sprite):
         else:
             screen.blit(self.disabled_surf, self.rect)
 
+    def render_state(self, gamestate):
+        return gamestate.ready_for_next_round(), self.hovered
+
     def handle_click(self, gamestate, _: Tuple[int, int]):
         if gamestate.ready_for_next_round():  # Only move on if we've made a choice for each prompt
             play_click_sound(gamestate)
             gamestate.transition_round()
 
+    def set_hovered(self, hovered: bool):
+        self.hovered = hovered
+
+    def register_input(self, router):
+        router.add_click(self.rect, self.handle_click)
+        router.add_hover(self.rect, self.set_hovered)
+
 
 class GenericButton(Sprite):
     def __init__(self, button_pos: Tuple[int, int], file_basename: str, handle_click_func: Callable[[], Any]):
         super().__init__()
 
         # Button states
-        self.unhovered_surf = image.load(ASSETS_DIR / "buttons" / f"{file_basename}_up.png").convert()
-        self.hovered_surf = image.load(ASSETS_DIR / "buttons" / f"{file_basename}_hover.png").convert()
+        self.unhovered_surf = load_image(ASSETS_DIR / "buttons" / f"{file_basename}_up.png")
+        self.hovered_surf = load_image(ASSETS_DIR / "buttons" / f"{file_basename}_hover.png")
 
         self.rect = self.unhovered_surf.get_rect(topleft=button_pos)  # Button position
-        self.hovered = self.rect.collidepoint(mouse.get_pos())  # Whether or not the player is hovering over the button
+        self.hovered = self.rect.collidepoint(mouse_pos())  # Whether or not the player is hovering over the button
         self.click_func = handle_click_func
 
     def draw(self, screen, _):
@@ -196,23 +290,33 @@ class GenericButton(Sprite):
         else:
             screen.blit(self.unhovered_surf, self.rect)
 
+    def render_state(self, _):
+        return self.hovered
+
     def handle_click(self, gamestate, _: Tuple[int, int]):
         play_click_sound(gamestate)
         self.click_func()
 
+    def set_hovered(self, hovered: bool):
+        self.hovered = hovered
+
+    def register_input(self, router):
+        router.add_click(self.rect, self.handle_click)
+        router.add_hover(self.rect, self.set_hovered)
+
 
 class MuteButton(Sprite):
     def __init__(self, button_pos: Tuple[int, int]):
         super().__init__()
 
         # Button states
-        self.muted_unhovered_surf = image.load(ASSETS_DIR / "buttons" / "soundoff_up.png").convert()
-        self.muted_hovered_surf = image.load(ASSETS_DIR / "buttons" / "soundoff_hover.png").convert()
-        self.unmuted_unhovered_surf = image.load(ASSETS_DIR / "buttons" / "soundon_up.png").convert()
-        self.unmuted_hovered_surf = image.load(ASSETS_DIR / "buttons" / "soundon_hover.png").convert()
+        self.muted_unhovered_surf = load_image(ASSETS_DIR / "buttons" / "soundoff_up.png")
+        self.muted_hovered_surf = load_image(ASSETS_DIR / "buttons" / "soundoff_hover.png")
+        self.unmuted_unhovered_surf = load_image(ASSETS_DIR / "buttons" / "soundon_up.png")
+        self.unmuted_hovered_surf = load_image(ASSETS_DIR / "buttons" / "soundon_hover.png")
 
         self.rect = self.muted_unhovered_surf.get_rect(topleft=button_pos)  # Button position
-        self.hovered = self.rect.collidepoint(mouse.get_pos())  # Whether or not the player is hovering over the button
+        self.hovered = self.rect.collidepoint(mouse_pos())  # Whether or not the player is hovering over the button
 
     def draw(self, screen, gamestate):
         if gamestate.muted:
@@ -226,15 +330,25 @@ class MuteButton(Sprite):
             else:
                 screen.blit(self.unmuted_unhovered_surf, self.rect)
 
+    def render_state(self, gamestate):
+        return gamestate.muted, self.hovered
+
     def handle_click(self, gamestate, _: Tuple[int, int]):
         play_click_sound(gamestate)
         gamestate.toggle_mute()
 
+    def set_hovered(self, hovered: bool):
+        self.hovered = hovered
+
+    def register_input(self, router):
+        router.add_click(self.rect, self.handle_click)
+        router.add_hover(self.rect, self.set_hovered)
+
 
 class Title(Sprite):
     def __init__(self):
         super().__init__()
-        self.surf = image.load(ASSETS_DIR / "title.png").convert_alpha()
+        self.surf = load_image(ASSETS_DIR / "title.png", CONVERT_ALPHA)
         self.rect = self.surf.get_rect()
 
     def draw(self, screen, _):
@@ -248,12 +362,16 @@ class TextArea(Sprite):
     #           TextArea("new value", 24, center=(20, 30))
     def __init__(self, value: str, font_size: int, *_, **pos):
         super().__init__()
-        font = SysFont(COMIC_SANS, font_size)
-        self.text = font.render(value, True, FONT_COLOR)
-        if "topleft" in pos:
-            self.rect = self.text.get_rect(topleft=pos["topleft"])
-        elif "center" in pos:
-            self.rect = self.text.get_rect(center=pos["center"])
+        self.font = get_font(COMIC_SANS, font_size)
+        self.pos = pos
+        self.set_text(value)
+
+    def set_text(self, value: str):
+        self.text = render_text(self.font, value, FONT_COLOR)
+        if "topleft" in self.pos:
+            self.rect = self.text.get_rect(topleft=self.pos["topleft"])
+        elif "center" in self.pos:
+            self.rect = self.text.get_rect(center=self.pos["center"])
         else:
             self.rect = self.text.get_rect()
 
@@ -264,16 +382,58 @@ class TextArea(Sprite):
 class TextAreaWrapped(Sprite):
     def __init__(self, area: Rect, value: str, font: Font, color: Tuple[int, int, int], centered=False):
         super().__init__()
-        self.surf = Surface(area.size, SRCALPHA)
+        self.font = font
+        self.color = color
+        self.centered = centered
         self.rect = area
-        draw_text_wrapped(self.surf, value, color, Rect((0, 0), area.size), font, centered)
+        self.set_text(value)
+
+    def set_text(self, value: str):
+        self.surf = render_text_wrapped(value, self.color, self.rect.size, self.font, self.centered)
+
+    def prerender(self, value: str):
+        # Gets the text's surface into the paragraph cache, for a set_text() coming up
+        render_text_wrapped(value, self.color, self.rect.size, self.font, self.centered)
 
     def draw(self, screen, _):
         screen.blit(self.surf, self.rect)
 
 
-# Totally not stolen from the internet
-def draw_text_wrapped(surface, text, color, rect, font, centered=False):
+def results_text(results: Dict[str, int]) -> str:
+    return ", ".join(f"{METERS_SHORTHAND[k]}: {'+' if v > 0 else ''}{v}" for k, v in results.items() if v != 0)
+
+
+# Finished paragraph surfaces, keyed by everything that affects how they look. Least recently used entries get evicted
+# once the cache is full. These surfaces are shared between text areas, so never draw onto them.
+PARAGRAPH_CACHE_SIZE = 256
+paragraph_cache: "OrderedDict[tuple, Surface]" = OrderedDict()
+
+
+def render_text_wrapped(text: str, color: Tuple[int, int, int], size: Tuple[int, int], font: Font,
+                        centered=False) -> Surface:
+    key = (text, font, tuple(color), tuple(size), centered)
+    surf = paragraph_cache.get(key)
+    if surf is not None:
+        paragraph_cache.move_to_end(key)
+        return surf
+
+    surf = Surface(size, SRCALPHA)
+    scaler = scaling.scaler
+    if scaler is None:
+        draw_text_wrapped(surf, text, color, Rect((0, 0), size), font, centered)
+    else:
+        # The same lines again with the font at the output size, for the display to show instead
+        scaled = Surface(scaler.size(size), SRCALPHA)
+        draw_text_wrapped(surf, text, color, Rect((0, 0), size), font, centered, scaled)
+        scaler.register(surf, scaled)
+    paragraph_cache[key] = surf
+    if len(paragraph_cache) > PARAGRAPH_CACHE_SIZE:
+        paragraph_cache.popitem(last=False)
+    return surf
+
+
+def draw_text_wrapped(surface, text, color, rect, font, centered=False, scaled_surface=None):
+    # scaled_surface gets the same lines at scaling.scaler's scale, drawn with the font rasterized at that size
     rect = Rect(rect)
     y = rect.top
     line_spacing = -2
@@ -281,23 +441,13 @@ def draw_text_wrapped(surface, text, color, rect, font, centered=False):
     # get the height of the font
     font_height = font.size("Tg")[1]
 
-    while text:
-        i = 1
-
-        # determine if the row of text will be outside our area
-        if y + font_height > rect.bottom:
-            break
-
-        # determine maximum width of line
-        while font.size(text[:i])[0] < rect.width and i <= len(text):
-            i += 1
-
-        # if we've wrapped the text, then adjust the wrap to the last word
-        if i <= len(text):
-            i = text.rfind(" ", 0, i) + 1
+    # only lay out as many lines as fit in our area
+    max_lines = max(0, (rect.height - font_height) // (font_height + line_spacing) + 1)
 
+    lines, text = wrap_text(text, font, rect.width, max_lines)
+    for line in lines:
         # render the line and blit it to the surface
-        text_surf = font.render(text[:i], True, color)
+        text_surf = font.render(line, True, color)
 
         # Do text centering
         line_left = rect.left
@@ -306,9 +456,85 @@ def draw_text_wrapped(surface, text, color, rect, font, centered=False):
 
         # Do the blit
         surface.blit(text_surf, (line_left, y))
+        if scaled_surface is not None:
+            draw_scaled_line(scaled_surface, line, color, rect, font, centered, y)
         y += font_height + line_spacing
 
-        # remove the text we just blitted
-        text = text[i:]
-
     return text
+
+
+def draw_scaled_line(surface, line, color, rect, font, centered, y):
+    scaler = scaling.scaler
+    text_surf = scaler.font(font).render(line, True, color)
+    scaled_rect = scaler.rect(rect)
+    if text_surf.get_width() > scaled_rect.w:
+        # Glyphs don't grow in exact proportion to the font size, and the line was only measured at the logical size
+        text_surf = transform.smoothscale(text_surf, (scaled_rect.w, text_surf.get_height()))
+    line_left = scaled_rect.left
+    if centered:
+        line_left += (scaled_rect.w - text_surf.get_width()) // 2
+    surface.blit(text_surf, (line_left, scaler.rect((0, y, 0, 0)).top))
+
+
+# Splits text into at most max_lines lines narrower than width, breaking after the last space that still fits.
+# Returns the lines and whatever text did not fit.
+#
+# Each word is measured once, and the cumulative word widths give a first guess at each break. Kerning can make the
+# real width of a line differ slightly from the sum of its words, so the guess is then checked against font.size and
+# nudged one word at a time until it is exact. That keeps the output identical to measuring the line one character at
+# a time, while doing a couple of font.size calls per line instead of one per character.
+def wrap_text(text: str, font: Font, width: int, max_lines: int) -> Tuple[List[str], str]:
+    words = text.split(" ")
+    space_width = font.size(" ")[0]
+    word_widths = {}
+    for word in words:
+        if word not in word_widths:
+            word_widths[word] = font.size(word)[0]
+
+    # breaks[j] is the index in text where the jth space sits, estimates[j] is the estimated width of text up to it.
+    # The end of the text is tacked on as a final pseudo-break.
+    breaks = []
+    estimates = []
+    pos = 0
+    total = 0
+    for word in words:
+        pos += len(word)
+        total += word_widths[word]
+        breaks.append(pos)
+        estimates.append(total)
+        pos += 1
+        total += space_width
+    end = len(breaks) - 1
+
+    def fits(start, stop):
+        return font.size(text[start:stop])[0] < width
+
+    lines = []
+    start = 0  # Where the current line starts in text
+    first = 0  # First break that can end the current line
+    while start < len(text) and len(lines) < max_lines:
+        # Guess the last break that fits using the estimated widths, then correct it
+        offset = estimates[first - 1] + space_width if first > 0 else 0
+        j = bisect_left(estimates, offset + width, first) - 1
+        if j >= first and not fits(start, breaks[j]):
+            while j >= first and not fits(start, breaks[j]):
+                j -= 1
+        else:
+            j = max(j, first - 1)
+            while j < end and fits(start, breaks[j + 1]):
+                j += 1
+
+        if j == end:
+            # The rest of the text fits on this line
+            lines.append(text[start:])
+            start = len(text)
+        elif j >= first:
+            # Break after the space, keeping it at the end of the line
+            lines.append(text[start:breaks[j] + 1])
+            start = breaks[j] + 1
+            first = j + 1
+        else:
+            # Not even the first word fits, nothing more can be laid out
+            lines.extend([""] * (max_lines - len(lines)))
+
+    return lines, text[start:]
@@ -0,0 +1,79 @@
+import json
+import os
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+# Startup bookkeeping: a trace of how long each step of startup took, and the queue of work that got pushed back until
+# after the first frame so the title screen shows up as early as possible.
+
+
+def unpacked_at() -> Optional[float]:
+    # A pyinstaller onefile build unpacks itself into sys._MEIPASS before Python even starts. The folder is created
+    # first thing, so its creation time is as close to the process start as we can get without platform specific APIs.
+    # st_birthtime exists on macOS, st_ctime is the creation time on Windows.
+    if not getattr(sys, "frozen", False):
+        return None
+    stat = os.stat(sys._MEIPASS)
+    return getattr(stat, "st_birthtime", stat.st_ctime)
+
+
+class StartupTrace:
+    def __init__(self):
+        # Time zero is when this module got imported, which main.py does before anything else. Frozen builds go back
+        # further, to when they started unpacking.
+        self.origin = perf_counter()
+        self.unpack_time: Optional[float] = None
+        unpacked = unpacked_at()
+        if unpacked is not None:
+            self.unpack_time = max(0.0, time.time() - unpacked)
+            self.origin -= self.unpack_time
+        self.marks: List[Tuple[str, float]] = []
+        self.first_frame: Optional[float] = None
+
+    def mark(self, name: str):
+        self.marks.append((name, perf_counter() - self.origin))
+
+    def frame_presented(self):
+        if self.first_frame is None:
+            self.mark("first frame")
+            self.first_frame = self.marks[-1][1]
+
+    def report(self, caches: Optional[Dict[str, dict]] = None) -> dict:
+        # caches: how the caches did over the session, by name (see AssetCache.stats() and FontRegistry.stats())
+        return {
+            "frozen": bool(getattr(sys, "frozen", False)),
+            "unpack_ms": None if self.unpack_time is None else self.unpack_time * 1000,
+            "time_to_first_frame_ms": None if self.first_frame is None else self.first_frame * 1000,
+            "marks": [{"name": name, "ms": t * 1000} for name, t in self.marks],
+            "caches": caches or {}
+        }
+
+    def write(self, path: Path, caches: Optional[Dict[str, dict]] = None):
+        with path.open("w") as fp:
+            json.dump(self.report(caches), fp, indent=2)
+
+
+startup_trace = StartupTrace()
+
+
+class DeferredLoader:
+    # Work that is not needed for the first frame. One job runs per frame once the game is up, so nothing blocks the
+    # screen for long, and anything that needs a job's result early can just do the work itself.
+    def __init__(self):
+        self.jobs: Deque[Tuple[str, Callable[[], None]]] = deque()
+
+    def add(self, name: str, job: Callable[[], None]):
+        self.jobs.append((name, job))
+
+    def run_next(self):
+        if self.jobs:
+            name, job = self.jobs.popleft()
+            job()
+            startup_trace.mark(name)
+
+    def done(self) -> bool:
+        return not self.jobs
@@ -0,0 +1,52 @@
+import copy
+import json
+
+import pytest
+
+from consts import *
+from engine import effect_table
+from scenario_pack import compile_pack, PackEffects, ScenarioPack, SCHEMA_PATH
+
+
+@pytest.fixture(scope="module")
+def scenarios():
+    with (ASSETS_DIR / "scenarios.json").open(encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+@pytest.fixture(scope="module")
+def schema():
+    with SCHEMA_PATH.open(encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def test_pack_round_trips_the_json(tmp_path, scenarios, schema):
+    path = tmp_path / "scenarios.pack"
+    path.write_bytes(compile_pack(scenarios, schema))
+    pack = ScenarioPack(path)
+
+    assert len(pack) == len(scenarios)
+    for packed, scenario in zip(pack, scenarios):
+        assert {key: packed[key] for key in packed} == {key: scenario[key] for key in packed}
+    assert pack[-1][SCENARIO_TEXT] == scenarios[-1][SCENARIO_TEXT]
+    with pytest.raises(IndexError):
+        pack[len(scenarios)]
+    # Packs serve the same effect table the JSON scenarios get
+    assert list(PackEffects(pack)) == effect_table(scenarios)
+
+
+def test_compile_rejects_invalid_scenarios(scenarios, schema):
+    missing = copy.deepcopy(scenarios)
+    del missing[3][CHOICE_TWO_RESULTS][METERS[0]]
+    with pytest.raises(ValueError, match=r"\$\[3\]"):
+        compile_pack(missing, schema)
+
+    with pytest.raises(ValueError):
+        compile_pack([], schema)
+
+
+def test_open_rejects_other_files(tmp_path):
+    path = tmp_path / "scenarios.pack"
+    path.write_bytes(bytes(4096))
+    with pytest.raises(ValueError):
+        ScenarioPack(path)
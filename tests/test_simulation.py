@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from engine import GameEngine, load_scenarios
+from simulation import BatchSimulation, fire_chance, greedy_policy, random_policy
+
+
+class RecordingGenerator:
+    # Passes everything through to a numpy Generator, keeping what random() came up with last: in a quarter that ends
+    # the year that's the board's dice rolls, the last thing BatchSimulation.step draws
+    def __init__(self, rng: np.random.Generator):
+        self.rng = rng
+        self.last = None
+
+    def random(self, *args, **kwargs):
+        self.last = self.rng.random(*args, **kwargs)
+        return self.last
+
+    def __getattr__(self, name):
+        return getattr(self.rng, name)
+
+
+class Roll:
+    # Stands in for a GameEngine's RNG, rolling whatever the batch rolled for the same game
+    def __init__(self, value: float):
+        self.value = value
+
+    def random(self) -> float:
+        return self.value
+
+
+@pytest.mark.parametrize("policy", [random_policy, greedy_policy])
+def test_batch_matches_the_engine(policy):
+    scenarios = load_scenarios()
+    sim = BatchSimulation(scenarios, 300, seed=7)
+    sim.rng = RecordingGenerator(sim.rng)
+    engines = [GameEngine(scenarios) for _ in range(sim.games)]
+
+    for _ in range(6 * 4):
+        if not sim.alive.any():
+            break
+        running, draws, choices = sim.step(policy)
+        for row, game in enumerate(running):
+            engine = engines[game]
+            engine.current_indices = tuple(int(index) for index in draws[row])
+            for prompt, choice in enumerate(choices[row]):
+                engine.choose(prompt, int(choice))
+            assert engine.ready_for_next_round()
+            if engine.quarter == 4:
+                engine.rng = Roll(float(sim.rng.last[row]))
+            engine.end_quarter()
+
+            assert engine.meters == sim.meters[game].tolist()
+            assert (engine.year, engine.quarter) == (sim.year, sim.quarter)
+            assert engine.fired == (not sim.alive[game])
+            assert engine.get_fire_chance() == pytest.approx(fire_chance(sim.meters[game]))
+    assert not sim.alive.all()  # Some games got as far as being fired
@@ -0,0 +1,48 @@
+import json
+import random
+
+import pygame
+import pytest
+
+from consts import ASSETS_DIR, CHOICE_ONE, CHOICE_TWO, SCENARIO_TEXT
+from sprites import wrap_text
+
+
+def original_wrap(text, font, width, max_lines):
+    # The wrapping draw_text_wrapped did before wrap_text, growing each line a character at a time, minus the drawing
+    lines = []
+    while text and len(lines) < max_lines:
+        i = 1
+        while font.size(text[:i])[0] < width and i <= len(text):
+            i += 1
+        if i <= len(text):
+            i = text.rfind(" ", 0, i) + 1
+        lines.append(text[:i])
+        text = text[i:]
+    return lines, text
+
+
+@pytest.fixture(scope="module")
+def fonts():
+    pygame.font.init()
+    yield [pygame.font.Font(None, size) for size in (14, 20, 27)]
+    pygame.font.quit()
+
+
+def texts():
+    with (ASSETS_DIR / "scenarios.json").open() as fp:
+        scenarios = json.load(fp)
+    for scenario in scenarios:
+        yield from (scenario[SCENARIO_TEXT], scenario[CHOICE_ONE], scenario[CHOICE_TWO])
+    rng = random.Random(0)
+    words = ["a", "of", "board", "quarterly", "shareholders", "AVeryLongWordThatFitsNowhere", "Q3", "x" * 12]
+    for _ in range(50):
+        yield " ".join(rng.choice(words) for _ in range(rng.randint(1, 40)))
+
+
+@pytest.mark.parametrize("width", [40, 120, 230, 500])
+def test_wrap_text_matches_the_original(fonts, width):
+    for font in fonts:
+        for text in texts():
+            for max_lines in (1, 3, 50):
+                assert wrap_text(text, font, width, max_lines) == original_wrap(text, font, width, max_lines), text